@@ -5,9 +5,11 @@ import lib.stddraw as stddraw
 from lib.picture import Picture
 from lib.color import Color
 import os
-from game_grid import GameGrid
+import sys
+from ai_player import AIPlayer
+from game_session import GameSession
+from replay import ReplayWriter, REPLAY_EXTENSION
 from tetromino import Tetromino
-import random
 import time
 import pygame.mixer
 
@@ -18,9 +20,15 @@ TARGET_FPS = 30
 INITIAL_GRAVITY_INTERVAL = 0.8
 MUSIC_FILE = os.path.join("sounds", "Tetris.mp3")
 INITIAL_VOLUME = 0.2
-
-# The main function where this program starts execution
-def start():
+# Set to a directory (e.g. "replays") to record every game as a replay file
+REPLAY_DIR = None
+# Only draw a frame when the game changed since the last drawn frame (see
+# GameGrid.version), so a paused or finished game leaves the CPU idle
+RENDER_ON_CHANGE = True
+
+# The main function where this program starts execution (with ai_mode set,
+# the computer plays the game)
+def start(ai_mode=False):
     # set the dimensions of the game grid
     grid_h, grid_w = 20, 12
 
@@ -38,7 +46,7 @@ def start():
     music_playing = False
     try:
         pygame.mixer.init()
-        current_dir = os.path.dirname(os.path.realpath(_file_))
+        current_dir = os.path.dirname(os.path.realpath(__file__))
         music_file_path = os.path.join(current_dir, MUSIC_FILE)
 
         if os.path.exists(music_file_path):
@@ -63,7 +71,7 @@ def start():
     # start the game loop
     try:
         while True: # Allows restarting the game
-            restart_game = play_game(grid_h, grid_w, preview_area_width)
+            restart_game = play_game(grid_h, grid_w, preview_area_width, ai_mode)
             if not restart_game:
                 break # Exit if play_game returns False (e.g., user pressed Escape)
     finally:
@@ -75,10 +83,41 @@ def start():
 
     print("Game exited.") # Optional message
 
-def play_game(grid_h, grid_w, preview_area_width):
+# A function for starting the replay of the game of session in a new file in
+# REPLAY_DIR, named after the current time (with a number added when a game
+# of the same second already took that name, as after a quick restart)
+def start_replay(session, grid_h, grid_w):
+    os.makedirs(REPLAY_DIR, exist_ok=True)
+    name = time.strftime("%Y%m%d-%H%M%S")
+    number = 1
+    while True:
+        suffix = "" if number == 1 else f"-{number}"
+        try:
+            return ReplayWriter(os.path.join(REPLAY_DIR, name + suffix + REPLAY_EXTENSION),
+                                session.pieces.seed, grid_h, grid_w)
+        except FileExistsError:
+            number += 1
+
+# The GameSession actions for the keys used in the game
+KEY_ACTIONS = {"left": "left", "right": "right", "down": "soft_drop",
+               "up": "rotate", "space": "hard_drop"}
+
+def play_game(grid_h, grid_w, preview_area_width, ai_mode=False):
     """Plays one instance of the game. Returns True if restart requested, False to exit."""
-    # create the game grid
-    grid = GameGrid(grid_h, grid_w)
+    # create the headless game session that runs the game logic
+    session = GameSession(grid_h, grid_w)
+    grid = session.grid
+    # the computer player (in AI mode) and the actions left of its plan
+    ai_player = AIPlayer() if ai_mode else None
+    ai_plan = []
+    if grid.game_over:
+        print("Game Over: Cannot spawn initial piece.") # Debug message
+
+    # Record the actions of the game (with the frames they were taken in)
+    recorder = None
+    if REPLAY_DIR is not None:
+        recorder = start_replay(session, grid_h, grid_w)
+    frame = 0
 
     # Timing control
     target_fps = TARGET_FPS
@@ -86,171 +125,119 @@ def play_game(grid_h, grid_w, preview_area_width):
     gravity_interval = INITIAL_GRAVITY_INTERVAL
     last_gravity_time = time.time()
 
-    # --- Initial Piece Creation ---
-    # Create the very first piece directly
-    current_tetromino = create_tetromino()
-    grid.current_tetromino = current_tetromino
-    # Validate its initial spawn position
-    if not current_tetromino.can_be_moved("down", grid, check_initial=True):
-        print("Game Over: Cannot spawn initial piece.") # Debug message
-        grid.game_over = True
-        current_tetromino = None  # Ensure it's None if spawn failed
-        grid.current_tetromino = None
-        next_tetromino = None # No next piece either
-        grid.next_tetromino = None
-    else:
-        # If the first piece spawns successfully, create the next piece for the preview
-        next_tetromino = create_tetromino()
-        grid.next_tetromino = next_tetromino  # assign it to the grid object
-
     # Game state variables
     paused = False
     # grid.game_over is already initialized based on initial spawn check
+    drawn_version = None # the grid version shown by the last drawn frame
 
-    # the main game loop
-    while True:
-        start_time = time.time() # Record frame start time
-
-        # --- Input Handling ---
-        hard_dropped = False # Reset hard drop flag each frame
-        if stddraw.hasNextKeyTyped():
-            key_typed = stddraw.nextKeyTyped()
-
-            # Pause/resume with 'p' key
-            if key_typed == "p":
-                paused = not paused
-                if paused:
-                    pause_start_time = time.time()
-                    if pygame.mixer.music.get_busy():
-                        pygame.mixer.music.pause()
-                else:
-                    pause_duration = time.time() - pause_start_time
-                    last_gravity_time += pause_duration
-                    if not pygame.mixer.music.get_busy():
-                        pygame.mixer.music.unpause()
-                stddraw.clearKeysTyped()
-
-            # Restart with 'r' key
-            elif key_typed == "r":
-                stddraw.clearKeysTyped()
-                return True # Signal to restart
-
-            # Exit with 'escape' key
-            elif key_typed == "escape":
-                stddraw.clearKeysTyped()
-                return False # Signal to exit
-
-            # --- Active Game Input (only if not paused/over) ---
-            elif not paused and not grid.game_over and current_tetromino is not None:
-                moved = False
-                rotated = False
-                if key_typed == "left":
-                    moved = current_tetromino.move(key_typed, grid)
-                elif key_typed == "right":
-                    moved = current_tetromino.move(key_typed, grid)
-                elif key_typed == "down":
-                    moved = current_tetromino.move(key_typed, grid)
-                    if moved:
-                         last_gravity_time = time.time()
-                elif key_typed == "up":
-                    rotated = current_tetromino.rotate(grid)
-                elif key_typed == "space":
-                    while current_tetromino.move("down", grid):
-                        pass
-                    hard_dropped = True
-
-        # --- Game Logic (only if not paused/over) ---
-        if not paused and not grid.game_over and current_tetromino is not None:
-            # Automatic downward movement (gravity)
-            current_time = time.time()
-            gravity_move_attempted = False
-            if not hard_dropped and current_time - last_gravity_time >= gravity_interval:
-                success_gravity = current_tetromino.move("down", grid)
-                last_gravity_time = current_time # Reset timer regardless of success
-                gravity_move_attempted = True # Flag that gravity tried to move
-
-            # --- Landing Logic ---
-            # Check if the piece cannot move down after potential gravity/user move this frame,
-            # OR if it was hard dropped.
-            # The can_be_moved check is crucial here.
-            if hard_dropped or not current_tetromino.can_be_moved("down", grid):
-                # Lock the piece, check lines/merges, update score
-                tiles, pos = current_tetromino.get_min_bounded_tile_matrix(True)
-                # update_grid handles locking & checking game over due to overlap
-                grid.update_grid(tiles, pos)
-
-                # Check win condition (after grid updates)
-                if check_for_win(grid):
-                    display_win_screen(grid_h, grid_w)
-                    while True:
-                         if stddraw.hasNextKeyTyped():
-                              key = stddraw.nextKeyTyped()
-                              if key == 'r': return True
-                              if key == 'escape': return False
-                         stddraw.show(50)
-
-                # Check Game Over state from grid update OR inability to spawn next piece
-                if grid.game_over:
-                    current_tetromino = None # Clear current piece on game over
-                    grid.current_tetromino = None
-                    grid.next_tetromino = None # Also clear next piece display
-                    # Go to next loop iteration to display Game Over screen
-
-                else: # Game not over yet, proceed to spawn next piece cycle
-                    # 1. The piece previously in 'next' becomes the 'current'
-                    current_tetromino = grid.next_tetromino
-
-                    # Safety check: If next_tetromino was somehow None, it's an error state
-                    if current_tetromino is None:
-                         print("Error: grid.next_tetromino was None unexpectedly during piece transition.")
-                         grid.game_over = True
-                         grid.current_tetromino = None
-                         grid.next_tetromino = None
-                         next_tetromino = None # Clear local var just in case
+    # the main game loop (the replay is finished whatever way the game ends)
+    try:
+        while True:
+            start_time = time.time() # Record frame start time
+            frame += 1
+
+            # --- Input Handling ---
+            events = [] # Events of the session steps taken in this frame
+            if stddraw.hasNextKeyTyped():
+                key_typed = stddraw.nextKeyTyped()
+
+                # Pause/resume with 'p' key
+                if key_typed == "p":
+                    paused = not paused
+                    grid.bump_version() # the pause overlay is shown or hidden
+                    if paused:
+                        pause_start_time = time.time()
+                        if pygame.mixer.music.get_busy():
+                            pygame.mixer.music.pause()
                     else:
-                        # 2. Set the grid's current_tetromino reference
-                        grid.current_tetromino = current_tetromino
-
-                        # 3. Check if this newly assigned piece can actually spawn at its default location
-                        if not current_tetromino.can_be_moved("down", grid, check_initial=True):
-                            # Cannot spawn the piece that was in 'next' - Game Over!
-                            print("Game Over: Cannot spawn the next piece.") # Debug message
-                            grid.game_over = True
-                            current_tetromino = None # Clear the invalid current piece
-                            grid.current_tetromino = None
-                            grid.next_tetromino = None # Clear next display too
-                            next_tetromino = None # Clear local var
+                        pause_duration = time.time() - pause_start_time
+                        last_gravity_time += pause_duration
+                        if not pygame.mixer.music.get_busy():
+                            pygame.mixer.music.unpause()
+                    stddraw.clearKeysTyped()
+
+                # Restart with 'r' key
+                elif key_typed == "r":
+                    stddraw.clearKeysTyped()
+                    return True # Signal to restart
+
+                # Exit with 'escape' key
+                elif key_typed == "escape":
+                    stddraw.clearKeysTyped()
+                    return False # Signal to exit
+
+                # --- Active Game Input (only if not paused/over) ---
+                elif not paused and not grid.game_over and ai_player is None and \
+                     key_typed in KEY_ACTIONS:
+                    result = session.step(KEY_ACTIONS[key_typed])
+                    events += result.events
+                    if recorder is not None:
+                        recorder.record(frame, KEY_ACTIONS[key_typed], session)
+                    if key_typed == "down" and "moved" in result.events:
+                        last_gravity_time = time.time()
+
+            # --- Game Logic (only if not paused/over) ---
+            # The session locks a piece as soon as it cannot move down and spawns the next one
+            if not paused and not grid.game_over:
+                # Automatic downward movement (gravity), not in the frame a piece was locked
+                current_time = time.time()
+                if ai_player is not None:
+                    # The computer plays one action of its plan per frame and
+                    # works out the next plan in a worker thread (no gravity)
+                    if not ai_plan and not ai_player.thinking:
+                        placement = ai_player.poll()
+                        if placement is None:
+                            ai_player.start_thinking(grid)
                         else:
-                            # 4. Successfully spawned the current piece, now generate the next piece for the preview
-                            next_tetromino = create_tetromino()
-                            grid.next_tetromino = next_tetromino # Store it in the grid
-
+                            ai_plan = list(placement.actions) or ["tick"]
+                    if ai_plan:
+                        action = ai_plan.pop(0)
+                        events += session.step(action).events
+                        if recorder is not None:
+                            recorder.record(frame, action, session)
+                elif "locked" not in events and current_time - last_gravity_time >= gravity_interval:
+                    events += session.step("tick").events
+                    if recorder is not None:
+                        recorder.record(frame, "tick", session)
+                    last_gravity_time = current_time # Reset timer regardless of success
+
+                if "locked" in events:
+                    # Check win condition (after grid updates)
+                    if "won" in events:
+                        display_win_screen(grid_h, grid_w)
+                        while True:
+                             if stddraw.hasNextKeyTyped():
+                                  key = stddraw.nextKeyTyped()
+                                  if key == 'r': return True
+                                  if key == 'escape': return False
+                             stddraw.show(50)
+                    if "game_over" in events:
+                        print("Game Over: Cannot place or spawn the next piece.") # Debug message
                     # Reset gravity timer for the new piece (or for the game over state)
                     last_gravity_time = time.time()
 
-        # --- Drawing ---
-        # Pass grid's game_over flag to the display function
-        display_game_state(grid, paused, grid.game_over)
-
-        # --- Frame Rate Control ---
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        pause_duration_ms = (frame_duration - elapsed_time) * 1000
-        if pause_duration_ms < 0:
-            pause_duration_ms = 0 # Avoid negative pause
-
-        # The only stddraw.show() call should be this one
-        stddraw.show(pause_duration_ms) # Use calculated pause duration
-
-# ... (rest of the functions: check_for_win, display_game_state, display_pause_overlay, display_game_over_overlay, display_win_screen, display_controls_info, create_tetromino, display_game_menu remain the same)
+            # --- Drawing ---
+            if not RENDER_ON_CHANGE or grid.version != drawn_version:
+                # Pass grid's game_over flag to the display function
+                display_game_state(grid, paused, grid.game_over)
+                drawn_version = grid.version
+            else:
+                stddraw.clearDirty() # nothing changed, so nothing to present
+
+            # --- Frame Rate Control ---
+            end_time = time.time()
+            elapsed_time = end_time - start_time
+            pause_duration_ms = (frame_duration - elapsed_time) * 1000
+            if pause_duration_ms < 0:
+                pause_duration_ms = 0 # Avoid negative pause
+
+            # The only stddraw.show() call should be this one
+            stddraw.show(pause_duration_ms) # Use calculated pause duration
+    finally:
+        if recorder is not None:
+            recorder.close()
 
-# Helper function to check if any tile has reached 2048
-def check_for_win(grid):
-    for row in range(grid.grid_height):
-        for col in range(grid.grid_width):
-            if grid.tile_matrix[row][col] is not None and grid.tile_matrix[row][col].number >= 2048:
-                return True
-    return False
+# ... (rest of the functions: display_game_state, display_pause_overlay, display_game_over_overlay, display_win_screen, display_controls_info, display_game_menu remain the same)
 
 # Function to display the current state of the game
 def display_game_state(grid, paused, game_over):
@@ -262,6 +249,11 @@ def display_game_state(grid, paused, game_over):
         display_pause_overlay(grid.grid_width, grid.grid_height) # Pass dimensions for centering
     elif game_over:
         display_game_over_overlay(grid.score, grid.grid_width, grid.grid_height) # Pass score & dimensions
+    if paused or game_over:
+        # the overlays cover the grid, so present the whole canvas now and
+        # when they are gone (the grid only marks the cells that changed)
+        stddraw.markAllDirty()
+        grid.forget_display()
 
     # Display controls info at the bottom
     display_controls_info(grid.grid_width)
@@ -329,17 +321,6 @@ def display_controls_info(grid_width):
     stddraw.text((grid_width -1) / 2.0, -0.3, controls)
 
 
-# A function for creating random shaped tetrominoes to enter the game grid
-def create_tetromino():
-    # the type (shape) of the tetromino is determined randomly
-    tetromino_types = ['I', 'O', 'Z', 'J', 'L', 'S', 'T']
-    random_index = random.randint(0, len(tetromino_types) - 1)
-    random_type = tetromino_types[random_index]
-    # create and return the tetromino
-    tetromino = Tetromino(random_type)
-    return tetromino
-
-
 # A function for displaying a simple menu before starting the game
 def display_game_menu(grid_height, grid_width):
      # (Code for display_game_menu remains unchanged)
@@ -347,7 +328,7 @@ def display_game_menu(grid_height, grid_width):
     button_color = Color(25, 255, 228)
     text_color = Color(31, 160, 239)
     stddraw.clear(background_color)
-    current_dir = os.path.dirname(os.path.realpath(_file_))
+    current_dir = os.path.dirname(os.path.realpath(__file__))
     img_file = os.path.join(current_dir, "images", "menu_image.png") # Use os.path.join
     img_center_x, img_center_y = (grid_width - 1) / 2.0, grid_height - 7
     if not os.path.exists(img_file):
@@ -386,7 +367,7 @@ def display_game_menu(grid_height, grid_width):
                     break
 
 
-if _name_ == '_main_':
-    start()
+if __name__ == '__main__':
+    start(ai_mode="--ai" in sys.argv[1:])
 
 # --- END OF FILE Tetris_2048.py ---
@@ -0,0 +1,276 @@
+"""
+ai_player.py
+
+A computer player for Tetris 2048. For each piece it searches over the
+placements of the current piece, then of the next piece (both are known),
+then of a random third piece (an expectation over its types and its most
+likely tile numbers), and plays the placement with the best expected
+value. The boards at the leaves of the search are scored all at
+once with a vectorized heuristic, and the search deepens one piece at a
+time until a time budget runs out (iterative deepening with a beam): only
+the best placements of a level are searched deeper, and a level that is
+not finished in time is dropped or, for the next piece, cut short.
+
+The search can run in a worker thread (start_thinking and poll), so that
+the game loop of Tetris_2048.py keeps drawing frames while the player
+thinks. ai_policy makes a self-play policy (see self_play.py) that plays
+with a fixed depth instead of a time budget, so games are reproducible.
+"""
+
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from board_features import column_heights, holes, bumpiness, monotonicity
+from game_grid import GameGrid
+from piece_generator import TWO_PROBABILITY
+from placements import find_placements
+from tetromino import Tetromino, SHAPES
+from zobrist import TranspositionTable
+
+# The weights of the board features in the heuristic value of a board
+SCORE_WEIGHT = 1.0
+HEIGHT_WEIGHT = -2.0
+MAX_HEIGHT_WEIGHT = -4.0
+HOLE_WEIGHT = -30.0
+BUMPINESS_WEIGHT = -4.0
+MONOTONICITY_WEIGHT = -2.0
+TILE_WEIGHT = -2.0
+# The value of a board where the game is over
+GAME_OVER_VALUE = -1e9
+# The depth 3 search averages over the tile numbers of the third piece that
+# have at most this many 4s, the most likely ones (95% of the pieces have at
+# most one 4)
+THIRD_PIECE_MAX_FOURS = 1
+
+#-----------------------------------------------------------------------
+
+def evaluate_boards(boards):
+    """
+    Return the heuristic values of a stack of boards, an array of shape
+    (n, grid_h, grid_w) of tile exponents, as an array of n values (higher
+    is better). Low and flat stacks without holes score best, as do columns
+    whose tiles get smaller upwards, since these can keep merging.
+    """
+    boards = np.asarray(boards)
+    heights = column_heights(boards)
+    return (HEIGHT_WEIGHT * heights.sum(axis=1) + MAX_HEIGHT_WEIGHT * heights.max(axis=1) +
+            HOLE_WEIGHT * holes(boards, heights) + BUMPINESS_WEIGHT * bumpiness(boards, heights) +
+            MONOTONICITY_WEIGHT * monotonicity(boards) +
+            TILE_WEIGHT * np.count_nonzero(boards, axis=(1, 2)))
+
+def third_pieces(max_fours=THIRD_PIECE_MAX_FOURS):
+    """
+    Return (tetromino, probability) pairs for every piece type and every
+    combination of tile numbers with at most max_fours 4s, with the
+    probabilities of piece_generator (normalized over the combinations).
+    """
+    combinations = []
+    for numbers in itertools.product((2, 4), repeat=4):
+        fours = numbers.count(4)
+        if fours <= max_fours:
+            combinations.append((numbers, TWO_PROBABILITY ** (4 - fours) *
+                                 (1 - TWO_PROBABILITY) ** fours))
+    total = len(SHAPES) * sum(probability for _, probability in combinations)
+    return [(Tetromino(shape, numbers), probability / total)
+            for shape in SHAPES for numbers, probability in combinations]
+
+#-----------------------------------------------------------------------
+
+class _Node:
+    """
+    A board reached by locking a placement: the board, its column heights
+    and hash, the score gained on the way and the value of the node.
+    """
+
+    def __init__(self, placement, board, heights, board_hash, gain, game_over):
+        self.placement = placement
+        self.board = board
+        self.heights = heights
+        self.board_hash = board_hash
+        self.gain = gain
+        self.game_over = game_over
+        self.value = GAME_OVER_VALUE
+        # the best child of the node and the value of the node from it (depth 2)
+        self.best_child = None
+        self.depth_value = GAME_OVER_VALUE
+
+class AIPlayer:
+    """
+    Chooses the placements of the pieces of a game (see choose_placement).
+    time_budget is the time in seconds a choice may take (None for no
+    limit), max_depth the number of pieces searched (1: the current piece,
+    2: also the next piece, 3: also a random third piece) and beam_width the
+    number of placements of each level that are searched deeper.
+    """
+
+    def __init__(self, time_budget=0.5, max_depth=3, beam_width=6, cache_size=200000):
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.beam_width = beam_width
+        # the results of the cascades of the boards seen before, by board hash
+        self.cascade_cache = TranspositionTable(cache_size)
+        self._grid = None
+        self._thread = None
+        self._result = None
+        # the depth of the last finished level of the last search
+        self.depth_reached = 0
+
+    # Helper method: a grid for simulating locks with the given dimensions
+    def _scratch_grid(self, grid_h, grid_w):
+        if self._grid is None or self._grid.exponent_matrix.shape != (grid_h, grid_w):
+            self._grid = GameGrid(grid_h, grid_w)
+            self._grid.cascade_cache = self.cascade_cache
+        return self._grid
+
+    # Helper method: puts the board of node on the scratch grid
+    def _load(self, node):
+        grid = self._grid
+        grid.exponent_matrix[:] = node.board
+        grid.column_heights = node.heights.copy()
+        grid.board_hash = node.board_hash
+        grid.score = 0
+        grid.game_over = False
+
+    # Helper method: the nodes of the placements of tetromino on the board of node
+    def _expand(self, node, tetromino):
+        grid = self._grid
+        self._load(node)
+        children = []
+        for placement in find_placements(grid, tetromino):
+            self._load(node)
+            grid.lock_cells(placement.cells)
+            children.append(_Node(placement, grid.exponent_matrix.copy(),
+                                  grid.column_heights.copy(), grid.board_hash,
+                                  grid.score, grid.game_over))
+        # Score the boards of all children at once
+        alive = [child for child in children if not child.game_over]
+        if alive:
+            values = evaluate_boards([child.board for child in alive])
+            for child, value in zip(alive, values.tolist()):
+                child.value = child.gain * SCORE_WEIGHT + value
+        return children
+
+    # Helper method: the best value of placing tetromino on the board of node
+    def _best_value(self, node, tetromino):
+        children = self._expand(node, tetromino)
+        return max((child.value for child in children), default=GAME_OVER_VALUE)
+
+    # A method for choosing the placement of the current piece of grid
+    def choose_placement(self, grid):
+        """
+        Returns the placements.Placement of grid.current_tetromino with the
+        best value (None if there is no current piece or it has no
+        placement). The grid is not changed. A placement after which the
+        next piece cannot spawn ends the game and gets GAME_OVER_VALUE.
+        """
+        start_time = time.perf_counter()
+        deadline = None if self.time_budget is None else start_time + self.time_budget
+        def out_of_time():
+            return deadline is not None and time.perf_counter() > deadline
+
+        current, next_piece = grid.current_tetromino, grid.next_tetromino
+        if current is None:
+            return None
+        self._scratch_grid(grid.grid_height, grid.grid_width)
+        root = _Node(None, grid.exponent_matrix.copy(), grid.column_heights.copy(),
+                     grid.board_hash, 0, False)
+
+        # Depth 1: the placements of the current piece
+        children = self._expand(root, current)
+        if not children:
+            return None
+        children.sort(key=lambda child: child.value, reverse=True)
+        best = children[0]
+        self.depth_reached = 1
+        if self.max_depth < 2 or next_piece is None or best.game_over:
+            return best.placement
+
+        # Depth 2: the placements of the next piece after the best placements
+        # of the current piece, best first (cut short when out of time)
+        beam = [child for child in children[:self.beam_width] if not child.game_over]
+        searched = []
+        for child in beam:
+            if searched and out_of_time():
+                break
+            child.best_child = max(self._expand(child, next_piece), default=None,
+                                   key=lambda grandchild: grandchild.value)
+            if child.best_child is not None: # otherwise the next piece cannot spawn
+                child.depth_value = child.gain * SCORE_WEIGHT + child.best_child.value
+            searched.append(child)
+        best = max(searched, key=lambda child: child.depth_value)
+        if len(searched) < len(beam):
+            return best.placement
+        self.depth_reached = 2
+        if self.max_depth < 3:
+            return best.placement
+
+        # Depth 3: after the best placement of the next piece, the expected
+        # value of the best placement of a random third piece, over its types
+        # and its most likely tile numbers
+        pieces = third_pieces()
+        best_value = None
+        for child in beam:
+            grandchild = child.best_child
+            child_value = GAME_OVER_VALUE
+            if grandchild is not None and not grandchild.game_over:
+                expected_value = 0.0
+                for piece, probability in pieces:
+                    if out_of_time():
+                        return best.placement # the last finished depth
+                    expected_value += probability * self._best_value(grandchild, piece)
+                child_value = (child.gain + grandchild.gain) * SCORE_WEIGHT + expected_value
+            if best_value is None or child_value > best_value:
+                best_value, best3 = child_value, child
+        self.depth_reached = 3
+        return best3.placement
+
+    # A method for choosing the placement of the current piece of grid in a
+    # worker thread (on a copy of the grid), see poll
+    def start_thinking(self, grid):
+        thinking_grid = GameGrid(grid.grid_height, grid.grid_width)
+        thinking_grid.restore(grid.snapshot())
+        self._result = None
+        self._thread = threading.Thread(target=self._think, args=(thinking_grid,), daemon=True)
+        self._thread.start()
+
+    # Helper method: the body of the worker thread
+    def _think(self, grid):
+        self._result = self.choose_placement(grid)
+
+    # Whether a choice started by start_thinking is not finished yet
+    @property
+    def thinking(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # A method that returns the placement chosen in the worker thread once
+    # it is finished (None before)
+    def poll(self):
+        if self._thread is None or self._thread.is_alive():
+            return None
+        self._thread = None
+        return self._result
+
+#-----------------------------------------------------------------------
+
+def ai_policy(rng, max_depth=2):
+    """
+    Return a self-play policy that plays the placements chosen by an
+    AIPlayer searching max_depth pieces without a time limit (rng is not
+    used, the choices only depend on the game).
+    """
+    player = AIPlayer(time_budget=None, max_depth=max_depth)
+    plan = []
+    planned_piece = [None]
+
+    def policy(session):
+        piece = session.grid.current_tetromino
+        if piece is not planned_piece[0] or not plan:
+            planned_piece[0] = piece
+            placement = player.choose_placement(session.grid)
+            plan[:] = placement.actions if placement is not None and placement.actions else ["tick"]
+        return plan.pop(0)
+
+    return policy
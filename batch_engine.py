@@ -0,0 +1,288 @@
+from game_session import ACTIONS  # the actions accepted by the engine
+from tetromino import SHAPES, ROTATION_STATES  # the tetromino footprints
+import numpy as np  # fundamental Python module for scientific computing
+import time  # used for measuring the throughput
+
+# The tetromino types in the order of the type indexes used in the batch arrays
+PIECE_TYPES = tuple(SHAPES)
+# PIECE_OFFSETS[type, rotation] is a (4, 2) array of the (dx, dy) tile offsets
+PIECE_OFFSETS = np.array([[offsets for offsets, _ in ROTATION_STATES[shape]]
+                          for shape in PIECE_TYPES], dtype=np.int64)
+# The size n of the n x n tile matrix of each type (used for spawning)
+PIECE_SIZES = np.array([SHAPES[shape][0] for shape in PIECE_TYPES], dtype=np.int64)
+O_TYPE = PIECE_TYPES.index('O')
+
+# The index of each action in ACTIONS, the engine takes actions as these indexes
+ACTION_INDEXES = {action: index for index, action in enumerate(ACTIONS)}
+
+
+# A function for finding the tiles of the given (k, grid_h, grid_w) boards
+# that are 4-connected to the bottom row (grown from the bottom row over the
+# occupied cells of all boards at once until nothing is added)
+def _connected_to_floor(boards):
+    occupied = boards != 0
+    connected = np.zeros_like(occupied)
+    connected[:, 0] = occupied[:, 0]
+    while True:
+        grown = connected.copy()
+        grown[:, 1:] |= connected[:, :-1]
+        grown[:, :-1] |= connected[:, 1:]
+        grown[:, :, 1:] |= connected[:, :, :-1]
+        grown[:, :, :-1] |= connected[:, :, 1:]
+        grown &= occupied
+        if (grown == connected).all():
+            return connected
+        connected = grown
+
+
+# A class for advancing many games of Tetris 2048 at once
+class BatchGameEngine:
+    """
+    Holds n_games boards as an (n_games, grid_h, grid_w) array of tile
+    exponents (as in GameGrid.exponent_matrix) and applies one action per
+    game per step, following the rules of GameSession.step. Movement,
+    collision, locking, spawning and the cascades of merges, line clears and
+    falling tiles run on the whole batch at once, one cascade step per round
+    in the order of GameGrid.stabilize, so the cascade results are exactly
+    those of GameGrid.update_grid.
+    """
+
+    # A constructor for starting n_games new games
+    def __init__(self, n_games, grid_h=20, grid_w=12, seed=None):
+        self.n_games = n_games
+        self.grid_height, self.grid_width = grid_h, grid_w
+        self.rng = np.random.default_rng(seed)
+
+        n = n_games
+        self.boards = np.zeros((n, grid_h, grid_w), dtype=np.uint8)
+        self.scores = np.zeros(n, dtype=np.int64)
+        self.done = np.zeros(n, dtype=bool)
+        self.pieces_placed = np.zeros(n, dtype=np.int64)
+        # the current piece of each game: type index, rotation state, position
+        # of the bottom left cell and the exponents of its four tiles
+        self.piece_type = np.zeros(n, dtype=np.int64)
+        self.rotation = np.zeros(n, dtype=np.int64)
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.piece_exponents = np.zeros((n, 4), dtype=np.uint8)
+        # the next piece of each game
+        self.next_type = np.zeros(n, dtype=np.int64)
+        self.next_exponents = np.zeros((n, 4), dtype=np.uint8)
+        self.reset()
+
+    # A method for starting the given games (all games by default) over
+    def reset(self, games=None):
+        games = np.arange(self.n_games) if games is None else np.asarray(games)
+        self.boards[games] = 0
+        self.scores[games] = 0
+        self.done[games] = False
+        self.pieces_placed[games] = 0
+        self.next_type[games], self.next_exponents[games] = self._create_pieces(len(games))
+        self._spawn(games)
+
+    # Helper method: random piece types and tile exponents (2 with 90%, 4 with 10%)
+    def _create_pieces(self, count):
+        types = self.rng.integers(0, len(PIECE_TYPES), count)
+        exponents = np.where(self.rng.random((count, 4)) < 0.9, 1, 2).astype(np.uint8)
+        return types, exponents
+
+    # Helper method: makes the next piece the current one in the given games
+    # and creates new next pieces (a piece that cannot spawn ends the game)
+    def _spawn(self, games):
+        types = self.next_type[games]
+        self.piece_type[games] = types
+        self.piece_exponents[games] = self.next_exponents[games]
+        self.rotation[games] = 0
+        sizes = PIECE_SIZES[types]
+        # Spawn centered horizontally with the bottom row of the matrix at grid_height - n
+        self.x[games] = np.clip(self.grid_width // 2 - sizes // 2, 0, self.grid_width - sizes)
+        self.y[games] = self.grid_height - sizes
+        self.next_type[games], self.next_exponents[games] = self._create_pieces(len(games))
+        blocked = self._collides(games, self.rotation[games], self.x[games],
+                                 self.y[games], inside_only=True)
+        self.done[games[blocked]] = True
+
+    # Helper method: the tile cells of the current pieces of the given games
+    # with the given rotations and positions, as (rows, cols) arrays of shape (k, 4)
+    def _cells(self, games, rotations, xs, ys):
+        offsets = PIECE_OFFSETS[self.piece_type[games], rotations]
+        return ys[:, None] + offsets[..., 1], xs[:, None] + offsets[..., 0]
+
+    # Helper method: whether the current pieces of the given games collide at
+    # the given rotations and positions (tiles above the grid only collide
+    # when inside_only is set, as for rotations and spawning)
+    def _collides(self, games, rotations, xs, ys, inside_only=False):
+        rows, cols = self._cells(games, rotations, xs, ys)
+        outside = (cols < 0) | (cols >= self.grid_width) | (rows < 0)
+        if inside_only:
+            outside |= rows >= self.grid_height
+        in_grid = ~outside & (rows < self.grid_height)
+        occupied = np.zeros(rows.shape, dtype=bool)
+        owners = np.broadcast_to(games[:, None], rows.shape)
+        occupied[in_grid] = self.boards[owners[in_grid], rows[in_grid], cols[in_grid]] != 0
+        return (outside | occupied).any(axis=1)
+
+    # Helper method: how many rows the current pieces of the given games can fall
+    def _drop_distances(self, games):
+        rows, cols = self._cells(games, self.rotation[games], self.x[games], self.y[games])
+        # the column of the board under each tile, shape (k, 4, grid_height)
+        columns = self.boards[games[:, None], :, np.clip(cols, 0, self.grid_width - 1)]
+        below = (columns != 0) & (np.arange(self.grid_height) < rows[..., None])
+        # the highest occupied row below each tile (-1 for none)
+        highest = np.where(below.any(axis=2),
+                           self.grid_height - 1 - np.argmax(below[..., ::-1], axis=2), -1)
+        return (rows - highest - 1).min(axis=1)
+
+    # A method for applying one action (an index into ACTIONS) to every game
+    def step(self, actions):
+        """
+        Applies actions[i] to game i and locks the pieces that cannot move down
+        anymore, resolving the merges, line clears and falling tiles.
+        Returns (rewards, done): the score gained by each game in this step and
+        whether each game is over. Games that are over ignore their actions.
+        """
+        actions = np.asarray(actions)
+        rewards = np.zeros(self.n_games, dtype=np.int64)
+        active = ~self.done
+
+        # Moves to the left, to the right and down (soft drop and gravity)
+        for action, dx, dy in (("left", -1, 0), ("right", 1, 0),
+                               ("soft_drop", 0, -1), ("tick", 0, -1)):
+            games = np.flatnonzero(active & (actions == ACTION_INDEXES[action]))
+            if games.size:
+                xs, ys = self.x[games] + dx, self.y[games] + dy
+                free = ~self._collides(games, self.rotation[games], xs, ys)
+                self.x[games[free]], self.y[games[free]] = xs[free], ys[free]
+
+        # Clockwise rotations (O does not rotate), the rotated piece must be inside the grid
+        games = np.flatnonzero(active & (actions == ACTION_INDEXES["rotate"]) &
+                               (self.piece_type != O_TYPE))
+        if games.size:
+            rotations = (self.rotation[games] + 1) % 4
+            free = ~self._collides(games, rotations, self.x[games], self.y[games], inside_only=True)
+            self.rotation[games[free]] = rotations[free]
+
+        # Hard drops
+        games = np.flatnonzero(active & (actions == ACTION_INDEXES["hard_drop"]))
+        if games.size:
+            self.y[games] -= self._drop_distances(games)
+
+        # Lock the pieces that cannot move down anymore (again for pieces that
+        # spawn resting on the tiles below them)
+        while True:
+            games = np.flatnonzero(~self.done)
+            resting = self._collides(games, self.rotation[games], self.x[games], self.y[games] - 1)
+            if not resting.any():
+                break
+            self._lock(games[resting], rewards)
+
+        return rewards, self.done.copy()
+
+    # Helper method: locks the current pieces of the given games and spawns the next ones
+    def _lock(self, games, rewards):
+        rows, cols = self._cells(games, self.rotation[games], self.x[games], self.y[games])
+        # Locking a tile above the grid ends the game before anything is locked
+        above = (rows >= self.grid_height).any(axis=1)
+        self.done[games[above]] = True
+        games, rows, cols = games[~above], rows[~above], cols[~above]
+        self.boards[games[:, None], rows, cols] = self.piece_exponents[games]
+        self.pieces_placed[games] += 1
+
+        self._resolve(games, rewards)
+        self._spawn(games)
+
+    # Helper method: resolves the cascades of the boards of the given games
+    # (stable boards, as the locked pieces rest on stable boards)
+    def _resolve(self, games, rewards):
+        """
+        Follows the cycles of GameGrid.stabilize on all boards at once, one
+        cascade step per board and round: a board with mergeable pairs merges
+        the lowest pair of its leftmost column with pairs (the order of
+        GameGrid.check_and_merge_tiles), otherwise a board with full lines
+        clears them, and a board with neither is stable. The tiles left
+        floating by a step fall before the next round.
+        """
+        height = self.grid_height
+        while games.size:
+            boards = self.boards[games]
+            # pairs[k, row - 1, col] is True when the tile at row can merge into the one below
+            pairs = (boards[:, 1:] == boards[:, :-1]) & (boards[:, 1:] != 0)
+            merging = pairs.any(axis=(1, 2))
+            full_rows = boards.all(axis=2)
+            n_full = full_rows.sum(axis=1)
+            clearing = ~merging & (n_full > 0)
+            settling = clearing.copy()
+
+            # Merges: the upper tile is removed and the lower one doubled
+            index = np.flatnonzero(merging)
+            if index.size:
+                # the first pair in column-major order is in the leftmost column
+                first = np.argmax(pairs[index].transpose(0, 2, 1).reshape(index.size, -1), axis=1)
+                cols, rows = np.divmod(first, height - 1)
+                rows += 1 # the row of the upper tile
+                batch = np.arange(index.size)
+                merged = boards[index]
+                merged[batch, rows, cols] = 0
+                merged[batch, rows - 1, cols] += 1
+                gained = np.left_shift(1, merged[batch, rows - 1, cols].astype(np.int64))
+                self.boards[games[index]] = merged
+                rewards[games[index]] += gained
+                self.scores[games[index]] += gained
+                # tiles can only lose their support if they touched the removed tile
+                padded = np.pad(merged, ((0, 0), (0, 1), (1, 1)))
+                held = (padded[batch, rows + 1, cols + 1] != 0) | \
+                       (padded[batch, rows, cols] != 0) | (padded[batch, rows, cols + 2] != 0)
+                settling[index[held]] = True
+
+            # Line clears: the other rows move down in order and the top rows are emptied
+            index = np.flatnonzero(clearing)
+            if index.size:
+                cleared_full = full_rows[index]
+                cleared = np.where(cleared_full[..., None], boards[index], 0).astype(np.int64)
+                gained = np.where(cleared > 0, np.left_shift(1, cleared), 0).sum(axis=(1, 2))
+                order = np.argsort(cleared_full, axis=1, kind="stable")
+                compacted = np.take_along_axis(boards[index], order[..., None], axis=1)
+                compacted[np.arange(height) >= height - n_full[index, None]] = 0
+                self.boards[games[index]] = compacted
+                rewards[games[index]] += gained
+                self.scores[games[index]] += gained
+
+            # The tiles that rested on removed tiles or cleared lines may be floating now
+            self._settle_free_tiles(games[settling])
+            games = games[merging | clearing]
+
+    # Helper method: drops the floating tiles of the boards of the given games
+    # one row at a time, all boards at once: the floating clusters fall together
+    # and stop as soon as they touch a resting tile or reach the bottom row,
+    # which gives the same boards as GameGrid.settle_free_tiles
+    def _settle_free_tiles(self, games):
+        while games.size:
+            boards = self.boards[games]
+            floating = (boards != 0) & ~_connected_to_floor(boards)
+            falling = floating.any(axis=(1, 2))
+            games, boards, floating = games[falling], boards[falling], floating[falling]
+            # a floating tile is never right above a resting one, so the cell below it is free
+            tiles = np.where(floating, boards, 0)
+            boards[floating] = 0
+            boards[:, :-1] += tiles[:, 1:]
+            self.boards[games] = boards
+
+    # A method for measuring how many board steps per second the engine runs
+    def measure_throughput(self, n_steps=200):
+        """
+        Steps all games n_steps times with random actions (restarting the games
+        that are over) and returns the number of board steps per second.
+        """
+        start_time = time.perf_counter()
+        for _ in range(n_steps):
+            _, done = self.step(self.rng.integers(0, len(ACTIONS), self.n_games))
+            if done.any():
+                self.reset(np.flatnonzero(done))
+        elapsed_time = time.perf_counter() - start_time
+        return self.n_games * n_steps / elapsed_time
+
+
+if __name__ == '__main__':
+    for n_games in (1, 64, 1024):
+        engine = BatchGameEngine(n_games, seed=0)
+        print(f"{n_games:5d} games: {engine.measure_throughput():,.0f} board-steps/s")
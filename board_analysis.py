@@ -0,0 +1,82 @@
+"""
+board_analysis.py
+
+Helper functions for analysing the tiles on a game grid. A board is given
+as a 2D array indexed as [row][col], where row 0 is the bottom row of the
+grid and a non-zero entry marks an occupied cell (as in the exponent matrix
+of the GameGrid class). Only NumPy is used here, so these functions can be
+shared by the game grid and by any code that works on raw boards.
+"""
+
+import numpy as np  # fundamental Python module for scientific computing
+
+#-----------------------------------------------------------------------
+
+def _flood_fill(remaining, width, seeds):
+    """
+    Collect the flat indices of all cells 4-connected to the given seed
+    cells with an explicit stack (no recursion). remaining holds one byte
+    per cell, 1 for an occupied cell not reached yet; the reached cells are
+    cleared in it. Seeds that are empty or already reached are skipped.
+    """
+    size = len(remaining)
+    stack = []
+    for index in seeds:
+        if remaining[index]:
+            remaining[index] = 0
+            stack.append(index)
+    reached = []
+    while stack:
+        index = stack.pop()
+        reached.append(index)
+        col = index % width
+        # left, right, below and above neighbors of the cell
+        if col > 0 and remaining[index - 1]:
+            remaining[index - 1] = 0
+            stack.append(index - 1)
+        if col < width - 1 and remaining[index + 1]:
+            remaining[index + 1] = 0
+            stack.append(index + 1)
+        if index >= width and remaining[index - width]:
+            remaining[index - width] = 0
+            stack.append(index - width)
+        if index + width < size and remaining[index + width]:
+            remaining[index + width] = 0
+            stack.append(index + width)
+    return reached
+
+def _occupancy_bytes(board):
+    """
+    Return the occupancy of board as a bytearray in row-major order.
+    """
+    occupied = np.ascontiguousarray(np.asarray(board) != 0)
+    return bytearray(occupied.tobytes())
+
+#-----------------------------------------------------------------------
+
+def connected_to_floor(board):
+    """
+    Return a boolean matrix with the shape of board where True marks the
+    occupied cells that are 4-connected to an occupied cell of the bottom
+    row. The cost grows linearly with the number of occupied cells.
+    """
+    height, width = np.shape(board)
+    remaining = _occupancy_bytes(board)
+    connected = np.zeros(height * width, dtype=bool)
+    connected[_flood_fill(remaining, width, range(width))] = True
+    return connected.reshape(height, width)
+
+def find_clusters(board):
+    """
+    Split the occupied cells of board into 4-connected clusters. Return a
+    list with a (rows, cols) pair of index arrays for each cluster, in the
+    order of their lowest, leftmost cells.
+    """
+    width = np.shape(board)[1]
+    remaining = _occupancy_bytes(board)
+    clusters = []
+    for start in np.flatnonzero(board).tolist():
+        if remaining[start]:
+            cells = np.array(_flood_fill(remaining, width, (start,)))
+            clusters.append(np.divmod(cells, width))
+    return clusters
@@ -0,0 +1,174 @@
+"""
+board_features.py
+
+Evaluation features of game boards computed with NumPy, for one board or
+for a batch of boards at once. A board is a 2D array indexed as [row][col]
+with row 0 at the bottom, as the exponent matrix of the GameGrid class
+(0 for an empty cell, e for the tile number 2**e); a batch is a 3D array of
+boards, as the boards of BatchGameEngine. The features of a board are
+returned as NumPy scalars and those of a batch as arrays with one value per
+board. The arrays are only read, never copied or changed, so the exponent
+matrix of a grid can be passed as it is. The features that only depend on
+which cells are occupied also accept boolean occupancy arrays.
+"""
+
+import numpy as np
+
+#-----------------------------------------------------------------------
+
+def _as_batch(boards):
+    """
+    Return boards as a 3D array (a view with a batch axis of length 1 for a
+    single board) and whether it was a single board.
+    """
+    boards = np.asarray(boards)
+    if boards.ndim == 2:
+        return boards[np.newaxis], True
+    return boards, False
+
+def _result(values, single):
+    """
+    Return the values of a batch, or the only value for a single board.
+    """
+    return values[0] if single else values
+
+#-----------------------------------------------------------------------
+
+def column_heights(boards):
+    """
+    Return the height of each column (the highest occupied row + 1, 0 for
+    an empty column), with the shape of boards without the row axis.
+    """
+    batch, single = _as_batch(boards)
+    occupied = batch != 0
+    grid_h = batch.shape[1]
+    heights = np.where(occupied.any(axis=1),
+                       grid_h - np.argmax(occupied[:, ::-1], axis=1), 0)
+    return _result(heights, single)
+
+def holes(boards, heights=None):
+    """
+    Return the number of empty cells below the top of their column. The
+    column heights can be passed if they are known already.
+    """
+    batch, single = _as_batch(boards)
+    if heights is None:
+        heights = column_heights(batch)
+    heights = np.asarray(heights).reshape(len(batch), -1)
+    n_tiles = np.count_nonzero(batch, axis=(1, 2))
+    return _result(heights.sum(axis=1) - n_tiles, single)
+
+def bumpiness(boards, heights=None):
+    """
+    Return the sum of the height differences of neighboring columns. The
+    column heights can be passed if they are known already.
+    """
+    batch, single = _as_batch(boards)
+    if heights is None:
+        heights = column_heights(batch)
+    heights = np.asarray(heights).reshape(len(batch), -1)
+    return _result(np.abs(np.diff(heights, axis=1)).sum(axis=1), single)
+
+def row_transitions(boards):
+    """
+    Return the number of changes between occupied and empty cells along
+    the rows, counting the walls on both sides as occupied. Only the rows
+    up to the highest occupied row of each board are counted.
+    """
+    batch, single = _as_batch(boards)
+    occupied = batch != 0
+    n, grid_h, grid_w = occupied.shape
+    walled = np.ones((n, grid_h, grid_w + 2), dtype=bool)
+    walled[:, :, 1:-1] = occupied
+    per_row = np.count_nonzero(walled[:, :, 1:] != walled[:, :, :-1], axis=2)
+    # the empty rows above the stack have the same two transitions each
+    used_rows = np.arange(grid_h) < column_heights(batch).max(axis=1)[:, np.newaxis]
+    return _result((per_row * used_rows).sum(axis=1), single)
+
+def merge_pairs(boards):
+    """
+    Return the number of neighboring tiles with the same number, counted
+    separately as (vertical, horizontal) pairs. Vertical pairs merge right
+    away, horizontal pairs can merge when the tiles below them are cleared.
+    """
+    batch, single = _as_batch(boards)
+    vertical = (batch[:, 1:] == batch[:, :-1]) & (batch[:, 1:] != 0)
+    horizontal = (batch[:, :, 1:] == batch[:, :, :-1]) & (batch[:, :, 1:] != 0)
+    return (_result(np.count_nonzero(vertical, axis=(1, 2)), single),
+            _result(np.count_nonzero(horizontal, axis=(1, 2)), single))
+
+def monotonicity(boards):
+    """
+    Return how far the columns are from having tile numbers that get smaller
+    upwards: the sum of the exponent increases from each tile to the tile
+    right above it (0 for boards where no tile rests on a smaller one).
+    Tiles on smaller tiles block merges, as merging needs equal numbers.
+    """
+    batch, single = _as_batch(boards)
+    lower = batch[:, :-1].astype(np.int16)
+    upper = batch[:, 1:].astype(np.int16)
+    increase = np.where((lower != 0) & (upper != 0), np.maximum(upper - lower, 0), 0)
+    return _result(increase.sum(axis=(1, 2)), single)
+
+def floating_clusters(boards):
+    """
+    Return the number of 4-connected clusters of tiles that are not
+    connected to the bottom row (none on boards processed by a GameGrid).
+    Both the connection to the floor and the clusters are found by
+    spreading over the whole batch at once, one cell per step.
+    """
+    batch, single = _as_batch(boards)
+    occupied = batch != 0
+    # the tiles connected to the floor, starting from the tiles with no empty
+    # cell below them (all tiles of a stack without holes) and spreading out
+    connected = np.logical_and.accumulate(occupied, axis=1)
+    while True:
+        spread = connected.copy()
+        spread[:, 1:] |= connected[:, :-1]
+        spread[:, :-1] |= connected[:, 1:]
+        spread[:, :, 1:] |= connected[:, :, :-1]
+        spread[:, :, :-1] |= connected[:, :, 1:]
+        spread &= occupied
+        if np.array_equal(spread, connected):
+            break
+        connected = spread
+    floating = occupied & ~connected
+    # label the floating tiles with the smallest cell index of their cluster
+    n_cells = floating[0].size
+    no_label = n_cells
+    cell_index = np.arange(n_cells).reshape(floating.shape[1:])
+    labels = np.where(floating, cell_index, no_label)
+    while True:
+        spread = labels.copy()
+        np.minimum(spread[:, 1:], labels[:, :-1], out=spread[:, 1:])
+        np.minimum(spread[:, :-1], labels[:, 1:], out=spread[:, :-1])
+        np.minimum(spread[:, :, 1:], labels[:, :, :-1], out=spread[:, :, 1:])
+        np.minimum(spread[:, :, :-1], labels[:, :, 1:], out=spread[:, :, :-1])
+        spread[~floating] = no_label
+        if np.array_equal(spread, labels):
+            break
+        labels = spread
+    # each cluster has one cell that is labeled with its own index
+    return _result(np.count_nonzero(floating & (labels == cell_index), axis=(1, 2)), single)
+
+def board_features(boards):
+    """
+    Return a dict with all features of boards (see the functions above).
+    """
+    batch, single = _as_batch(boards)
+    heights = column_heights(batch)
+    vertical_pairs, horizontal_pairs = merge_pairs(batch)
+    features = {
+        "column_heights": heights,
+        "max_height": heights.max(axis=1),
+        "aggregate_height": heights.sum(axis=1),
+        "holes": holes(batch, heights),
+        "bumpiness": bumpiness(batch, heights),
+        "row_transitions": row_transitions(batch),
+        "vertical_pairs": vertical_pairs,
+        "horizontal_pairs": horizontal_pairs,
+        "monotonicity": monotonicity(batch),
+        "floating_clusters": floating_clusters(batch),
+        "tiles": np.count_nonzero(batch, axis=(1, 2)),
+    }
+    return {name: _result(values, single) for name, values in features.items()}
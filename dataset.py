@@ -0,0 +1,262 @@
+"""
+dataset.py
+
+Plays headless games of Tetris 2048 with a self-play policy and writes one
+record per step (the board and the pieces before the step, the action and
+the score gained) to a dataset directory, for example:
+
+    python3 dataset.py data --games 1000 --policy random_drops
+
+The records are stored in .npy shard files of a fixed number of records
+(the last shard holds the rest) with the structured dtype of record_dtype,
+and index.json lists the shards. The shards are filled through memory maps
+by a writer thread and only ever appended to, and any shard can be opened
+with np.load(path, mmap_mode='r') and sliced without reading the rest:
+
+    shards = open_shards("data")
+    boards = shards[0]["board"][:1000]
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+from game_session import GameSession, ACTIONS, RULES_VERSION
+from piece_generator import PIECE_TYPES
+from self_play import load_policy, POLICIES
+from tile import number_to_exponent
+
+INDEX_FILE = "index.json"
+# The number of records the game loop collects before handing them to the writer
+CHUNK_SIZE = 4096
+
+_TYPE_INDEXES = {shape: index for index, shape in enumerate(PIECE_TYPES)}
+
+#-----------------------------------------------------------------------
+
+def record_dtype(grid_h, grid_w):
+    """
+    Return the dtype of the records of a grid_h x grid_w game: the board
+    (tile exponents), the type index (in PIECE_TYPES, -1 for none), rotation,
+    position and tile exponents of the current piece and the type and tile
+    exponents of the next piece before the step, then the action (index in
+    ACTIONS), the score gained, the seed of the game and the step number.
+    """
+    return np.dtype([
+        ("board", np.uint8, (grid_h, grid_w)),
+        ("piece_type", np.int8), ("rotation", np.int8),
+        ("piece_x", np.int8), ("piece_y", np.int8),
+        ("piece_exponents", np.uint8, (4,)),
+        ("next_type", np.int8), ("next_exponents", np.uint8, (4,)),
+        ("action", np.uint8), ("reward", np.int32),
+        ("seed", np.int64), ("step", np.int32),
+    ])
+
+def open_shards(directory):
+    """
+    Return the shards of the dataset in directory as read-only memory maps.
+    """
+    with open(os.path.join(directory, INDEX_FILE)) as file:
+        index = json.load(file)
+    return [np.load(os.path.join(directory, shard["file"]), mmap_mode="r")
+            for shard in index["shards"]]
+
+#-----------------------------------------------------------------------
+
+class DatasetWriter:
+    """
+    Appends records (arrays of record_dtype) to the shards of a dataset
+    directory. add hands the records to a writer thread, which copies them
+    into memory-mapped shards of shard_size records and flushes each shard
+    when it is full. close writes the last shard and index.json.
+    """
+
+    def __init__(self, directory, grid_h, grid_w, shard_size=65536):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.grid_height, self.grid_width = grid_h, grid_w
+        self.dtype = record_dtype(grid_h, grid_w)
+        self.shard_size = shard_size
+        self.shards = [] # (file name, number of records)
+        self._shard = None
+        self._filled = 0
+        self._chunks = queue.Queue(maxsize=16)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self._thread.start()
+
+    def add(self, records):
+        """
+        Append records (an array of self.dtype, not used afterwards).
+        Raises the error of the writer thread if it failed.
+        """
+        if self._error is None and self._put(records):
+            return
+        raise self._error or RuntimeError("the dataset writer has stopped")
+
+    def _put(self, item):
+        """
+        Hand item to the writer thread, waiting for room in the queue only
+        as long as the thread runs. Returns whether the item was queued.
+        """
+        while self._thread.is_alive():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass # check again whether the writer thread failed meanwhile
+        return False
+
+    def _write_chunks(self):
+        try:
+            while True:
+                records = self._chunks.get()
+                if records is None:
+                    break
+                while len(records):
+                    if self._shard is None:
+                        self._open_shard()
+                    count = min(len(records), self.shard_size - self._filled)
+                    self._shard[self._filled:self._filled + count] = records[:count]
+                    self._filled += count
+                    records = records[count:]
+                    if self._filled == self.shard_size:
+                        self._close_shard()
+        except Exception as error:
+            self._error = error
+
+    def _shard_path(self, shard_index):
+        return os.path.join(self.directory, f"shard_{shard_index:05d}.npy")
+
+    def _open_shard(self):
+        path = self._shard_path(len(self.shards))
+        self._shard = np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype,
+                                                shape=(self.shard_size,))
+        self._filled = 0
+
+    def _close_shard(self):
+        shard, filled = self._shard, self._filled
+        path = shard.filename
+        shard.flush()
+        self._shard = None
+        if filled < self.shard_size:
+            # the last shard is cut to the records written to it
+            last = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=self.dtype,
+                                             shape=(filled,))
+            last[:] = shard[:filled]
+            last.flush()
+            del shard, last
+            os.replace(path + ".tmp", path)
+        self.shards.append((os.path.basename(path), filled))
+
+    def close(self):
+        """
+        Write the remaining records, the last shard and index.json.
+        """
+        if self._put(None):
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        if self._shard is not None:
+            self._close_shard()
+        index = {
+            "rules_version": RULES_VERSION,
+            "grid_height": self.grid_height,
+            "grid_width": self.grid_width,
+            "actions": list(ACTIONS),
+            "piece_types": list(PIECE_TYPES),
+            "fields": [name for name in self.dtype.names],
+            "records": sum(count for _, count in self.shards),
+            "shards": [{"file": name, "records": count} for name, count in self.shards],
+        }
+        with open(os.path.join(self.directory, INDEX_FILE), "w") as file:
+            json.dump(index, file, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._put(None):
+            # stop the writer thread without writing index.json, so a failed
+            # generation never looks like a complete dataset
+            self._thread.join()
+
+#-----------------------------------------------------------------------
+
+def _piece_fields(tetromino):
+    """
+    Return the type index, rotation, x, y and tile exponents of tetromino.
+    """
+    if tetromino is None:
+        return -1, 0, 0, 0, (0, 0, 0, 0)
+    return (_TYPE_INDEXES[tetromino.type], tetromino.rotation,
+            tetromino.bottom_left_cell.x, tetromino.bottom_left_cell.y,
+            [number_to_exponent(tile.number) for tile in tetromino.tiles])
+
+def generate(directory, n_games, policy_spec="random_drops", seed=0,
+             grid_h=20, grid_w=12, max_steps=100000, shard_size=65536):
+    """
+    Play n_games games (with the seeds seed, seed + 1, ...) with the policy
+    named by policy_spec and write their steps to the dataset in directory.
+    Returns the number of records written.
+    """
+    policy_factory = load_policy(policy_spec)
+    dtype = record_dtype(grid_h, grid_w)
+    chunk, filled, n_records = np.zeros(CHUNK_SIZE, dtype=dtype), 0, 0
+    with DatasetWriter(directory, grid_h, grid_w, shard_size) as writer:
+        for game_seed in range(seed, seed + n_games):
+            session = GameSession(grid_h, grid_w, seed=game_seed)
+            policy = policy_factory(random.Random(game_seed))
+            grid = session.grid
+            steps = 0
+            while not session.game_over and steps < max_steps:
+                record = chunk[filled]
+                record["board"] = grid.exponent_matrix
+                (record["piece_type"], record["rotation"], record["piece_x"],
+                 record["piece_y"], record["piece_exponents"]) = _piece_fields(grid.current_tetromino)
+                next_type, _, _, _, record["next_exponents"] = _piece_fields(grid.next_tetromino)
+                record["next_type"] = next_type
+                action = policy(session)
+                record["action"] = ACTIONS.index(action)
+                record["reward"] = session.step(action).score_delta
+                record["seed"], record["step"] = game_seed, steps
+                steps += 1
+                filled += 1
+                if filled == CHUNK_SIZE:
+                    writer.add(chunk)
+                    n_records += filled
+                    chunk, filled = np.zeros(CHUNK_SIZE, dtype=dtype), 0
+        writer.add(chunk[:filled])
+        n_records += filled
+    return n_records
+
+def _main():
+    parser = argparse.ArgumentParser(description="Write a dataset of Tetris 2048 self-play steps.")
+    parser.add_argument("directory", help="directory of the dataset")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--policy", default="random_drops",
+                        help="one of " + ", ".join(POLICIES) + " or module:function")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--grid-height", type=int, default=20)
+    parser.add_argument("--grid-width", type=int, default=12)
+    parser.add_argument("--max-steps", type=int, default=100000, help="step limit of a game")
+    parser.add_argument("--shard-size", type=int, default=65536, help="records per shard")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    n_records = generate(args.directory, args.games, args.policy, args.seed, args.grid_height,
+                         args.grid_width, args.max_steps, args.shard_size)
+    elapsed_time = time.perf_counter() - start_time
+    print(f"{n_records} records of {args.games} games in {elapsed_time:.1f} s "
+          f"({n_records / elapsed_time:.0f} records/s)")
+
+if __name__ == '__main__':
+    _main()
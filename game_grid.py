@@ -1,24 +1,45 @@
-import lib.stddraw as stddraw  # used for displaying the game grid
+# stddraw (used for displaying the game grid) is only imported by the first
+# drawing call (see tile.get_stddraw), so the game logic runs headless without pygame
 from lib.color import Color  # used for coloring the game grid
-from point import Point  # used for tile positions
+from tile import draw_tiles, get_stddraw, number_to_exponent, exponent_to_number
+from board_analysis import connected_to_floor, find_clusters
+from zobrist import board_hash, cell_keys, changed_cells_hash, piece_hash
+from tetromino import Tetromino, BOTTOM_PROFILES  # used for finding drop distances
 import numpy as np  # fundamental Python module for scientific computing
-import copy as cp
 
 
 # A class for modeling the game grid
 class GameGrid:
+    # the width (in cells) of the side panel that display draws to the right
+    # of the grid, with the next piece preview and the score
+    side_panel_width = 6
+
     # A constructor for creating the game grid based on the given arguments
     def __init__(self, grid_h, grid_w):
         # set the dimensions of the game grid as the given arguments
         self.grid_height = grid_h
         self.grid_width = grid_w
-        # create a tile matrix to store the tiles locked on the game grid
-        # Ensure dtype=object to store None or Tile instances
-        self.tile_matrix = np.full((grid_h, grid_w), None, dtype=object) # Kept from first version
+        # create an exponent matrix to store the tiles locked on the game grid
+        # each cell holds the exponent of its tile number (0 = empty, 1 = 2,
+        # 2 = 4, ...) so that the grid logic works on plain integers
+        self.exponent_matrix = np.zeros((grid_h, grid_w), dtype=np.uint8)
+        # the skyline of the grid: the height of each column, that is the
+        # highest occupied row + 1 (0 for an empty column)
+        self.column_heights = np.zeros(grid_w, dtype=np.int64)
+        # the Zobrist hash of the tiles locked on the grid (see zobrist.py),
+        # kept up to date by locking, stabilize, restore and set_board
+        self.board_hash = 0
+        self._cell_keys = cell_keys(grid_h, grid_w)[1]
+        # set to a zobrist.TranspositionTable to reuse the results of cascades
+        # on boards seen before (by board hash)
+        self.cascade_cache = None
         # create the tetromino that is currently being moved on the game grid
         self.current_tetromino = None
         # add storage for the next piece
         self.next_tetromino = None
+        # the PieceGenerator the pieces come from, if any (set by GameSession),
+        # its position is a part of the snapshots of the grid
+        self.piece_generator = None
         # the game_over flag shows whether the game is over or not
         self.game_over = False
         # set the color used for the empty grid cells
@@ -29,41 +50,40 @@ class GameGrid:
         # thickness values used for the grid lines and the grid boundaries
         self.line_thickness = 0.002
         self.box_thickness = 10 * self.line_thickness
+        # the parts of the display that never change (see _get_static_layers)
+        # and the size of a cell in pixels they were drawn for
+        self._static_layers = None
+        self._static_layers_cell_size = None
+        # what the last display showed, for finding the cells that changed
+        # since then (None: show the whole canvas, see forget_display)
+        self._displayed = None
         # Initialize score
         self.score = 0
-
-    # A method for displaying the game grid (Unchanged from first version)
+        # the total numbers of cleared lines and merged tile pairs in this game
+        self.total_lines_cleared = 0
+        self.total_merges = 0
+        # a counter increased whenever the displayed state changes (the pieces
+        # move or rotate, tiles are locked, the score changes, ...), so that a
+        # frame only needs to be drawn when it differs from the last one
+        self.version = 0
+
+    # A method for displaying the game grid
     def display(self):
+        stddraw = get_stddraw()
         # clear the background to empty_cell_color
         stddraw.clear(self.empty_cell_color)
+        # draw the side panel (the labels and the preview box) as one image
+        panel_layer, _ = self._get_static_layers()
+        stddraw.blits([panel_layer])
         # draw the game grid
         self.draw_grid()
         # draw the current/active tetromino if it is not None
         if self.current_tetromino is not None:
             self.current_tetromino.draw()
 
-        # Display the next tetromino in a preview box
+        preview_box_x, preview_box_y, preview_box_w, preview_box_h = self._preview_box()
+        # Display the next tetromino in the preview box
         if self.next_tetromino is not None:
-            preview_box_x = self.grid_width + 0.5
-            preview_box_w = 5  # Width of the preview box
-            preview_box_h = 4  # Height of the preview box
-            # Position the preview box somewhat vertically centered or towards the top
-            preview_box_y = self.grid_height - preview_box_h - 1.5
-
-            # "NEXT" Label
-            stddraw.setPenColor(Color(255, 255, 255))
-            stddraw.setFontFamily("Arial")
-            stddraw.setFontSize(18)
-            stddraw.text(preview_box_x + preview_box_w / 2,
-                         preview_box_y + preview_box_h + 0.5, "NEXT")
-
-            # Border for preview box
-            stddraw.setPenRadius(self.line_thickness)
-            stddraw.setPenColor(self.line_color)
-            stddraw.rectangle(preview_box_x, preview_box_y,
-                              preview_box_w, preview_box_h)
-            stddraw.setPenRadius() # Reset pen radius
-
             # Get the minimal representation of the next tetromino
             next_tiles = self.next_tetromino.get_min_bounded_tile_matrix()
 
@@ -74,45 +94,150 @@ class GameGrid:
                  offset_x = (preview_box_w - n_cols) / 2.0
                  offset_y = (preview_box_h - n_rows) / 2.0
 
-                 # Draw each tile of the next tetromino relative to the preview box
+                 # Draw the tiles of the next tetromino relative to the preview box
+                 preview_tiles = []
                  for r in range(n_rows):
                      for c in range(n_cols):
                          if next_tiles[r][c] is not None:
                              # Calculate draw position for the tile's center
                              draw_x = preview_box_x + offset_x + c + 0.5
                              draw_y = preview_box_y + offset_y + (n_rows - 1 - r) + 0.5 # Center of tile at this row
+                             preview_tiles.append((next_tiles[r][c].number, draw_x, draw_y))
+                 draw_tiles(preview_tiles)
 
-                             # Draw the tile using its draw method at the calculated position
-                             draw_point = Point(draw_x, draw_y)
-                             tile_to_draw = next_tiles[r][c]
-                             tile_to_draw.draw(draw_point) # Draw the tile
-
-        # Display score
+        # Display score (its label is a part of the side panel)
         stddraw.setPenColor(Color(255, 255, 255))
         stddraw.setFontFamily("Arial")
         stddraw.setFontSize(18)
         # Position score below the next piece preview
         score_x = preview_box_x + preview_box_w / 2 # Center under preview box
-        score_y_label = preview_box_y - 1.5 # Adjust spacing as needed
         score_y_value = preview_box_y - 2.5
-        stddraw.text(score_x, score_y_label, "SCORE")
         stddraw.text(score_x, score_y_value, str(self.score))
 
         # draw a box around the game grid
         self.draw_boundaries()
+        # only present the parts of the canvas that changed since the last display
+        self._mark_changes()
         # The stddraw.show() is called in the main game loop for animation control
 
-    # A method for drawing the cells and the lines of the game grid (Unchanged from first version)
+    # A method for noting that the displayed state changed (see version)
+    def bump_version(self):
+        self.version += 1
+
+    # A method for making the next display present the whole canvas, for
+    # when something else was drawn over the game since the last display
+    def forget_display(self):
+        self._displayed = None
+
+    # A method for getting the (row, col) cells of the locked tiles that
+    # changed since the last display (all occupied cells if there was none)
+    def get_changed_cells(self):
+        if self._displayed is None:
+            changed = self.exponent_matrix != 0
+        else:
+            changed = self.exponent_matrix != self._displayed[0]
+        rows, cols = np.nonzero(changed)
+        return list(zip(rows.tolist(), cols.tolist()))
+
+    # Helper method: marks the areas of the canvas that changed since the
+    # last display as dirty (see stddraw.clearDirty), or the whole canvas
+    # when there was no last display or the size of the cells changed
+    def _mark_changes(self):
+        stddraw = get_stddraw()
+        piece_tiles = set()
+        if self.current_tetromino is not None:
+            piece_tiles = set(self.current_tetromino.get_drawn_tiles())
+        next_piece = None
+        if self.next_tetromino is not None:
+            next_piece = (self.next_tetromino.type, self.next_tetromino.rotation,
+                          tuple(tile.number for tile in self.next_tetromino.tiles))
+        changed_cells = self.get_changed_cells()
+        displayed = (self.exponent_matrix.copy(), piece_tiles, next_piece,
+                     self.score, self._static_layers_cell_size)
+        last, self._displayed = self._displayed, displayed
+        if last is None or last[4] != displayed[4]:
+            return # the whole canvas is presented
+        stddraw.clearDirty()
+        # the locked tiles are drawn centered at (col + 0.5, row + 0.5)
+        for row, col in changed_cells:
+            stddraw.markDirty(col, row, 1, 1)
+        # the tiles of the current piece are drawn centered on their cells
+        for _, x, y in piece_tiles ^ last[1]:
+            stddraw.markDirty(x - 0.5, y - 0.5, 1, 1)
+        preview_box_x, preview_box_y, preview_box_w, preview_box_h = self._preview_box()
+        if next_piece != last[2]:
+            stddraw.markDirty(preview_box_x, preview_box_y, preview_box_w, preview_box_h)
+        if self.score != last[3]:
+            stddraw.markDirty(preview_box_x - 0.5, preview_box_y - 3, preview_box_w + 1, 1)
+
+    # Helper method: the position (bottom left corner) and the size of the
+    # box where the next tetromino is shown
+    def _preview_box(self):
+        preview_box_x = self.grid_width + 0.5
+        preview_box_w = 5  # Width of the preview box
+        preview_box_h = 4  # Height of the preview box
+        # Position the preview box somewhat vertically centered or towards the top
+        preview_box_y = self.grid_height - preview_box_h - 1.5
+        return preview_box_x, preview_box_y, preview_box_w, preview_box_h
+
+    # Helper method: the (pygame.Surface, x, y) images of the parts of the
+    # display that never change during a game, drawn once for the current
+    # size of the cells in pixels: the side panel next to the game grid (with
+    # the "NEXT" and "SCORE" labels and the preview box) and the inner lines
+    # of the game grid (transparent between the lines, as they are drawn on
+    # top of the locked tiles)
+    def _get_static_layers(self):
+        stddraw = get_stddraw()
+        cell_size = stddraw.pixelSize(1, 1)
+        if self._static_layers is None or self._static_layers_cell_size != cell_size:
+            panel_x = self.grid_width + 2.5  # the center of the 6 wide side panel
+            grid_x, grid_y = (self.grid_width - 1) / 2.0, (self.grid_height - 1) / 2.0
+            panel = stddraw.makeSprite(6, self.grid_height, self._draw_side_panel,
+                                       panel_x, grid_y)
+            # (half a cell wider on the right, for the ends of the horizontal lines)
+            lines = stddraw.makeSprite(self.grid_width + 0.5, self.grid_height,
+                                       self._draw_grid_lines, grid_x + 0.25, grid_y,
+                                       transparent=True)
+            self._static_layers = ((panel, panel_x, grid_y), (lines, grid_x + 0.25, grid_y))
+            self._static_layers_cell_size = cell_size
+        return self._static_layers
+
+    # Helper method: draws the labels and the preview box of the side panel
+    def _draw_side_panel(self):
+        stddraw = get_stddraw()
+        stddraw.clear(self.empty_cell_color)
+        preview_box_x, preview_box_y, preview_box_w, preview_box_h = self._preview_box()
+        # "NEXT" Label
+        stddraw.setPenColor(Color(255, 255, 255))
+        stddraw.setFontFamily("Arial")
+        stddraw.setFontSize(18)
+        stddraw.text(preview_box_x + preview_box_w / 2,
+                     preview_box_y + preview_box_h + 0.5, "NEXT")
+        # "SCORE" label below the next piece preview
+        stddraw.text(preview_box_x + preview_box_w / 2, preview_box_y - 1.5, "SCORE")
+        # Border for preview box
+        stddraw.setPenRadius(self.line_thickness)
+        stddraw.setPenColor(self.line_color)
+        stddraw.rectangle(preview_box_x, preview_box_y,
+                          preview_box_w, preview_box_h)
+        stddraw.setPenRadius() # Reset pen radius
+
+    # A method for drawing the cells and the lines of the game grid
     def draw_grid(self):
-        # for each cell of the game grid
-        for row in range(self.grid_height):
-            for col in range(self.grid_width):
-                # if the current grid cell is occupied by a tile
-                if self.tile_matrix[row][col] is not None:
-                    # draw this tile at its grid position (center point)
-                    draw_pos = Point(col + 0.5, row + 0.5)
-                    self.tile_matrix[row][col].draw(draw_pos) # Pass the center point
-        # draw the inner lines of the game grid
+        stddraw = get_stddraw()
+        # draw the tiles of all occupied cells of the game grid (at the center
+        # points of their grid positions) in one batch of pre-rendered images
+        rows, cols = np.nonzero(self.exponent_matrix)
+        exponents = self.exponent_matrix[rows, cols].tolist()
+        draw_tiles([(1 << exponent, col + 0.5, row + 0.5)
+                    for exponent, row, col in zip(exponents, rows.tolist(), cols.tolist())])
+        # draw the inner lines of the game grid (drawn once, see _get_static_layers)
+        _, lines_layer = self._get_static_layers()
+        stddraw.blits([lines_layer])
+
+    # Helper method: draws the inner lines of the game grid
+    def _draw_grid_lines(self):
+        stddraw = get_stddraw()
         stddraw.setPenColor(self.line_color)
         stddraw.setPenRadius(self.line_thickness)
         # x and y ranges for the game grid boundaries
@@ -124,8 +249,9 @@ class GameGrid:
             stddraw.line(start_x, y, end_x, y)
         stddraw.setPenRadius()  # reset the pen radius to its default value
 
-    # A method for drawing the boundaries around the game grid (Unchanged from first version)
+    # A method for drawing the boundaries around the game grid
     def draw_boundaries(self):
+        stddraw = get_stddraw()
         # draw a bounding box around the game grid as a rectangle
         stddraw.setPenColor(self.boundary_color)  # using boundary_color
         stddraw.setPenRadius(self.box_thickness)
@@ -134,17 +260,96 @@ class GameGrid:
         stddraw.rectangle(pos_x, pos_y, self.grid_width, self.grid_height)
         stddraw.setPenRadius()  # reset the pen radius to its default value
 
-    # A method used checking whether the grid cell is occupied (Unchanged from first version)
+    # A method for capturing the state of the game on this grid
+    def snapshot(self):
+        """
+        Returns the board, its hash, the score and counters, the current and
+        next pieces and the position of the piece generator as a flat tuple
+        of bytes, numbers and tuples (a few hundred bytes, immutable and
+        hashable).
+        Pass it to restore to go back to this state.
+        """
+        current, next_ = self.current_tetromino, self.next_tetromino
+        return (self.exponent_matrix.tobytes(),
+                self.column_heights.astype(np.uint16).tobytes(), self.board_hash,
+                self.score, self.total_lines_cleared, self.total_merges, self.game_over,
+                None if current is None else current.get_state(),
+                None if next_ is None else next_.get_state(),
+                None if self.piece_generator is None else self.piece_generator.position)
+
+    # A method for going back to a state captured by snapshot
+    def restore(self, snapshot):
+        (board, heights, self.board_hash, self.score, self.total_lines_cleared, self.total_merges,
+         self.game_over, current, next_, position) = snapshot
+        self.exponent_matrix[:] = np.frombuffer(board, dtype=np.uint8).reshape(
+            self.grid_height, self.grid_width)
+        self.column_heights = np.frombuffer(heights, dtype=np.uint16).astype(np.int64)
+        self.current_tetromino = None if current is None else Tetromino.from_state(current)
+        self.next_tetromino = None if next_ is None else Tetromino.from_state(next_)
+        if position is not None and self.piece_generator is not None:
+            self.piece_generator.seek(position)
+        self.bump_version()
+
+    # A method for replacing the tiles locked on the grid with the given board
+    # (a matrix of tile exponents), keeping the column heights and the board
+    # hash in step with it; every whole-board write should go through here
+    def set_board(self, board):
+        self.exponent_matrix[:] = np.asarray(board, dtype=np.uint8)
+        self._update_column_heights()
+        self.board_hash = board_hash(self.exponent_matrix)
+        self.bump_version()
+
+    # The Zobrist hash of the game state: the locked tiles and the types and
+    # tile numbers of the current and next pieces (not their positions)
+    @property
+    def zobrist_hash(self):
+        return (self.board_hash ^ piece_hash(self.current_tetromino, 0) ^
+                piece_hash(self.next_tetromino, 1))
+
+    # A method for getting the largest tile number locked on the game grid
+    def max_tile_number(self):
+        max_exponent = int(self.exponent_matrix.max())
+        return exponent_to_number(max_exponent) if max_exponent > 0 else 0
+
+    # A method for recomputing the column heights from the exponent matrix
+    # (called whenever tiles are removed or moved on the grid)
+    def _update_column_heights(self):
+        occupied = self.exponent_matrix != 0
+        # the first occupied cell from the top gives the height of the column
+        top_down_index = np.argmax(occupied[::-1], axis=0)
+        self.column_heights = np.where(occupied.any(axis=0),
+                                       self.grid_height - top_down_index, 0)
+
+    # A method for finding how many rows the given tetromino can fall from its
+    # current position before it lands on a tile or on the bottom of the grid
+    def drop_distance(self, tetromino):
+        x, y = tetromino.bottom_left_cell.x, tetromino.bottom_left_cell.y
+        distance = self.grid_height + tetromino.n
+        # only the lowest tile of the tetromino in each column can land
+        for dx, dy in BOTTOM_PROFILES[tetromino.type][tetromino.rotation]:
+            col, row = x + dx, y + dy
+            height = self.column_heights[col]
+            if row >= height:
+                # the tile is above the skyline, so it falls down onto it
+                gap = row - height
+            else:
+                # the tile is below an overhang, look for the first tile under it
+                tiles_below = np.flatnonzero(self.exponent_matrix[:row, col])
+                gap = row - (tiles_below[-1] + 1) if tiles_below.size > 0 else row
+            distance = min(distance, int(gap))
+        return distance
+
+    # A method used checking whether the grid cell is occupied
     def is_occupied(self, row, col):
          # Convert row/col to integers if they aren't already
         row, col = int(round(row)), int(round(col)) # Use round for robustness
 
         if not self.is_inside(row, col):
             return False # Outside grid is not occupied by definition
-        # Access the tile matrix to check if the cell is None or contains a Tile object
-        return self.tile_matrix[row][col] is not None
+        # A non-zero exponent means the cell contains a tile
+        return self.exponent_matrix[row, col] != 0
 
-    # A method for checking whether the cell is inside the game grid (Unchanged from first version)
+    # A method for checking whether the cell is inside the game grid
     def is_inside(self, row, col):
          # Convert row/col to integers if they aren't already
         row, col = int(round(row)), int(round(col)) # Use round for robustness
@@ -156,196 +361,173 @@ class GameGrid:
             return False
         return True
 
-    # --- NEW: find_connected_tiles using DFS (from second version) ---
+    # A method for finding the tiles connected to the bottom of the grid
     def find_connected_tiles(self):
         """
-        Identify tiles that are connected to the bottom of the grid using DFS.
-        (Logic from second version)
+        Identify tiles that are connected to the bottom of the grid.
+        Uses an iterative flood fill from the occupied cells of the bottom row.
         Returns a boolean matrix where True indicates a connected tile.
         """
-        connected = np.full((self.grid_height, self.grid_width), False, dtype=bool) # Ensure boolean dtype
-
-        # Start DFS from all occupied tiles in the bottom row (row 0)
-        for col in range(self.grid_width):
-            if self.tile_matrix[0][col] is not None:
-                # Use integer indices for grid access
-                self._dfs_connect(0, col, connected)
-
-        return connected
-
-    # --- NEW: DFS helper method (from second version) ---
-    def _dfs_connect(self, row, col, connected):
-        """Helper method for DFS to mark connected tiles (Logic from second version)"""
-        # Ensure indices are integers
-        row, col = int(round(row)), int(round(col))
-
-        # Check bounds, already visited, or empty cell
-        if not self.is_inside(row, col) or \
-           connected[row][col] or \
-           self.tile_matrix[row][col] is None:
-            return
-
-        # Mark the current tile as connected
-        connected[row][col] = True
-
-        # Recursively check 4-connected neighbors (right, left, up, down)
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        for dr, dc in directions:
-            self._dfs_connect(row + dr, col + dc, connected)
-    # --- NEW: handle_free_tiles using _move_tile_down (from second version) ---
-    def handle_free_tiles(self):
+        return connected_to_floor(self.exponent_matrix)
+
+    # A method for dropping the tiles that are not connected to the bottom of the grid
+    def settle_free_tiles(self):
         """
-        Attempts to move tiles that are not connected to the bottom down ONE step.
-        (Logic from second version - may require multiple calls for full drop)
-        Returns True if any tile was moved down one step in this pass, False otherwise.
+        Drops every floating cluster of tiles straight to its resting place.
+        Floating clusters fall together one row at a time and stop as soon as
+        they reach the bottom row or touch a resting tile (below or beside
+        them). Instead of stepping row by row, the fall distance of each
+        cluster is computed directly, in the order the clusters come to rest,
+        which gives the same final grid as the stepwise drop.
+        Returns True if any tile was moved, False otherwise.
         """
-        # Find connected tiles using the DFS method
         connected = self.find_connected_tiles()
-        tile_moved_this_pass = False
-
-        # Process tiles from bottom to top (row 1 upwards) to handle dependencies correctly
-        for row in range(1, self.grid_height):
-            for col in range(self.grid_width):
-                # Check if it's a tile and it's floating
-                if self.tile_matrix[row][col] is not None and not connected[row][col]:
-                    # Attempt to move this tile down one step using the helper
-                    if self._move_tile_down(row, col):
-                        tile_moved_this_pass = True
-                        # Note: After moving, the 'connected' status isn't updated here.
-                        # The calling context (e.g., update_grid loop) needs to handle stability.
-
-        return tile_moved_this_pass
-
-    # --- NEW: Helper method for handle_free_tiles (from second version) ---
-    def _move_tile_down(self, row, col):
-        """
-        Moves the tile at (row, col) down ONE grid cell if the cell below is empty.
-        (Helper for handle_free_tiles, logic from second version)
-        Returns True if the tile was moved, False otherwise.
-        """
-        # Ensure indices are integers
-        row, col = int(round(row)), int(round(col))
-
-        # Basic checks: tile exists, not already at bottom
-        if row <= 0 or self.tile_matrix[row][col] is None:
+        floating = (self.exponent_matrix != 0) & ~connected
+        if not floating.any():
             return False
 
-        # Check if the cell directly below is inside the grid and is empty
-        if self.is_inside(row - 1, col) and self.tile_matrix[row - 1][col] is None:
-            # Move the tile down one step
-            self.tile_matrix[row - 1][col] = self.tile_matrix[row][col]
-            self.tile_matrix[row][col] = None
-            return True # Tile moved
-
-        return False # Tile could not be moved down one step
+        # Lift the floating clusters off the grid, keeping their exponents
+        clusters = [(rows, cols, self.exponent_matrix[rows, cols])
+                    for rows, cols in find_clusters(floating)]
+        self.exponent_matrix[floating] = 0
+        # The fall distance at which each resting cell stopped (-1 = no resting tile)
+        rest_drop = np.where(connected, 0, -1)
+
+        while clusters:
+            drops = [self._find_drop_distance(rows, cols, rest_drop) for rows, cols, _ in clusters]
+            drop = min(drops)
+            # Place the clusters that stop first, the others may now land on them
+            falling = []
+            for cluster, cluster_drop in zip(clusters, drops):
+                rows, cols, exponents = cluster
+                if cluster_drop == drop:
+                    self.exponent_matrix[rows - drop, cols] = exponents
+                    rest_drop[rows - drop, cols] = drop
+                else:
+                    falling.append(cluster)
+            clusters = falling
 
+        self._update_column_heights()
+        return True
 
-    # A method for check and clear lines (Unchanged from first version, but ensure return value)
+    # Helper method for settle_free_tiles: the number of rows a floating cluster falls
+    def _find_drop_distance(self, rows, cols, rest_drop):
+        """
+        Returns the first fall distance at which the cluster reaches the bottom
+        row or touches a resting cell. A cell that came to rest after falling d
+        rows is only there for fall distances of at least d.
+        """
+        # The cluster stops at the latest when its lowest tile reaches row 0
+        distance = int(rows.min())
+        grid_rows = np.arange(self.grid_height)[:, None]
+        for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            neighbor_cols = cols + dc
+            inside = (neighbor_cols >= 0) & (neighbor_cols < self.grid_width)
+            if not inside.any():
+                continue
+            # Falling d rows puts the tile at row r - d, next to the cell at row r - d + dr
+            drops = rows[inside] + dr - grid_rows
+            rested_at = rest_drop[:, neighbor_cols[inside]]
+            touching = (rested_at >= 0) & (drops >= np.maximum(rested_at, 1))
+            if touching.any():
+                distance = min(distance, int(drops[touching].min()))
+        return distance
+
+
+    # A method for checking and clearing the completed lines
     def check_and_clear_lines(self):
         """
-      Checks for and clears completed lines from bottom to top.
-      Shifts the rows above cleared lines down.
-      Returns number of lines cleared in this step. Adds score for cleared tiles.
-      (Logic unchanged from first version)
-      """
-        lines_cleared = 0
-        # Create a temporary new matrix to hold the state after clearing/shifting
-        new_tile_matrix = np.full((self.grid_height, self.grid_width), None, dtype=object)
-        # Index for writing rows into the new matrix (starts from bottom)
-        write_row = 0
-
-        # Iterate through the original grid rows from bottom (0) to top
-        for read_row in range(self.grid_height):
-            is_row_full = True
-            row_score = 0
-            for col in range(self.grid_width):
-                tile = self.tile_matrix[read_row][col]
-                if tile is None:
-                    is_row_full = False
-                    # No need to check rest of row if looking for fullness
-                    break
-                else:
-                    # Accumulate score potential only if row turns out full
-                    row_score += tile.number
-
-            if not is_row_full:
-                # If row is not full, copy it to the next available spot in the new matrix
-                if write_row < self.grid_height: # Bounds check
-                    new_tile_matrix[write_row] = self.tile_matrix[read_row].copy() # Copy the row
-                    write_row += 1 # Move write index up for the next non-full row
-            else:
-                # Row IS full. Increment cleared count and add score.
-                # Do NOT copy this row to the new matrix.
-                lines_cleared += 1
-                self.score += row_score # Add score from the cleared line
-
-        # After checking all rows, if lines were cleared, update the grid's matrix
-        if lines_cleared > 0:
-            self.tile_matrix = new_tile_matrix # Replace old matrix with the shifted one
+        Checks for and clears completed lines with a single pass over the grid.
+        Shifts the rows above cleared lines down in place.
+        Returns number of lines cleared in this step. Adds score for cleared tiles.
+        """
+        # A row is full when none of its cells is empty
+        full_rows = self.exponent_matrix.all(axis=1)
+        lines_cleared = int(np.count_nonzero(full_rows))
+        if lines_cleared == 0:
+            return 0 # Nothing to clear, the grid is left untouched
+
+        self.total_lines_cleared += lines_cleared
+        # Every tile on a cleared line adds its number to the score
+        cleared_exponents = self.exponent_matrix[full_rows].astype(np.int64)
+        self.score += int((1 << cleared_exponents).sum())
+
+        # Move the remaining rows down (keeping their order) and empty the top rows
+        kept_rows = self.grid_height - lines_cleared
+        self.exponent_matrix[:kept_rows] = self.exponent_matrix[~full_rows]
+        self.exponent_matrix[kept_rows:] = 0
+        self._update_column_heights()
 
         return lines_cleared # Return the number of lines cleared
 
 
-    # --- NEW: check_and_merge_tiles (from second version) ---
-    def check_and_merge_tiles(self):
+    # A method for checking and merging the tiles with the same number
+    def check_and_merge_tiles(self, grid_is_stable=False):
         """
         Check for and merge adjacent tiles with the same number vertically.
-        Merging happens downwards (upper tile merges into lower tile).
-        Calls handle_free_tiles repeatedly after each merge until stable.
-        Loops checking for merges until no merges occur in a full pass.
-        (Logic from second version)
+        Merging happens downwards (upper tile merges into lower tile), from the
+        bottom of each column up, with the columns handled left to right.
+        The mergeable pairs of all columns are found at once by comparing every
+        row with the row below it. Each column is then resolved on its own as
+        long as its merges leave no tile floating; when a merge does, the free
+        tiles are settled and the pairs are searched again on the whole grid.
+        This gives the same result as merging one pair at a time and
+        rescanning the grid after each merge.
+        grid_is_stable can be set when no tile is floating (e.g. after locking
+        a resting piece on a stable grid), otherwise the first merge settles.
         Returns the total score gained from merges in this invocation.
         """
-        total_merge_score_this_invocation = 0
-        merge_occurred_in_cycle = True # Flag to control the outer loop
-
-        # Continue checking for merges as long as a merge happened in the previous pass
-        while merge_occurred_in_cycle:
-            merge_occurred_in_cycle = False # Reset for this pass
-
-            # Check columns left to right
-            for col in range(self.grid_width):
-                # Check rows from bottom up (index 1 to height - 1)
-                # Compare tile at row with tile at row-1
-                for row in range(1, self.grid_height):
-                    tile_current = self.tile_matrix[row][col]     # Upper tile
-                    tile_below = self.tile_matrix[row - 1][col] # Lower tile
-
-                    # Check if both tiles exist and have the same number
-                    if (tile_current is not None and tile_below is not None and
-                        tile_current.number == tile_below.number):
-
-                        # --- Perform Merge ---
-                        new_value = tile_below.number * 2
-                        # Update the lower tile's number and color
-                        self.tile_matrix[row - 1][col].update_number_and_color(new_value)
-                        # Remove the upper tile
-                        self.tile_matrix[row][col] = None
-
-                        # --- Score ---
-                        merge_score = new_value
-                        total_merge_score_this_invocation += merge_score
-                        self.score += merge_score # Update total game score
-
-                        # --- State Change ---
-                        merge_occurred_in_cycle = True # Mark that a merge happened
-
-                        # --- Handle Falling Tiles Immediately After Merge ---
-                        # Call handle_free_tiles repeatedly until stable
-                        while self.handle_free_tiles():
-                            pass # Keep calling until no more single steps happen
-
-                        # --- Restart Scan After Merge and Fall ---
-                        # Break inner loop (rows) to re-scan this column from bottom after change
-                        break # Crucial to re-evaluate from bottom after merge/fall
-
-                # If the inner loop was broken (due to a merge in this column),
-                # break the outer loop too to restart the whole 'while' cycle
-                if merge_occurred_in_cycle:
-                    break # Break from the column loop
-
+        merged_exponents = [] # The exponents of the tiles created by the merges
+        tiles_fell = True
+
+        while tiles_fell:
+            tiles_fell = False
+            # pairs[row - 1][col] is True when the tile at row can merge into the one below
+            upper, lower = self.exponent_matrix[1:], self.exponent_matrix[:-1]
+            pairs = (upper == lower) & (upper != 0)
+            for col in np.flatnonzero(pairs.any(axis=0)).tolist():
+                tiles_fell, grid_is_stable = self._merge_column(col, merged_exponents, grid_is_stable)
+                if tiles_fell:
+                    break # The falling tiles may have changed any column
+
+        if merged_exponents:
+            self.total_merges += len(merged_exponents)
+            self._update_column_heights()
+
+        # Score all merges of this invocation at once
+        total_merge_score_this_invocation = int(
+            (1 << np.array(merged_exponents, dtype=np.int64)).sum())
+        self.score += total_merge_score_this_invocation
         return total_merge_score_this_invocation
 
+    # Helper method for check_and_merge_tiles: merges the pairs of one column from the bottom up
+    def _merge_column(self, col, merged_exponents, grid_is_stable):
+        """
+        Merges the pairs in the given column until none is left, appending the
+        exponent of each merged tile to merged_exponents.
+        Returns a (tiles_fell, grid_is_stable) pair, where tiles_fell is True as
+        soon as a merge makes tiles fall (the column is left unfinished then).
+        """
+        column = self.exponent_matrix[:, col] # A view, so updates go to the grid
+        while True:
+            pair_rows = np.flatnonzero((column[1:] == column[:-1]) & (column[1:] != 0))
+            if pair_rows.size == 0:
+                return False, grid_is_stable
+            row = int(pair_rows[0]) + 1 # The upper tile of the lowest pair
+            # Double the lower tile's number (one more in exponent form) and remove the upper tile
+            column[row - 1] += 1
+            column[row] = 0
+            merged_exponents.append(int(column[row - 1]))
+
+            # On a stable grid, tiles can only lose their support if they touched the removed tile
+            held_tiles = (row + 1 < self.grid_height and column[row + 1] != 0) or \
+                         (col > 0 and self.exponent_matrix[row, col - 1] != 0) or \
+                         (col + 1 < self.grid_width and self.exponent_matrix[row, col + 1] != 0)
+            if held_tiles or not grid_is_stable:
+                grid_is_stable = True
+                if self.settle_free_tiles():
+                    return True, grid_is_stable
+
 
     # --- MODIFIED: update_grid sequence using new logic ---
     def update_grid(self, tiles_to_lock, blc_position):
@@ -354,35 +536,71 @@ class GameGrid:
         merges, line clears, and falling tiles until the grid stabilizes.
         Uses the handling logic/sequence derived from the second version.
         """
-        # Lock the tiles onto the grid (Adapted from first version)
-        self.current_tetromino = None
+        # Map the matrix cells to grid cells relative to the bounded box's bottom-left position
         n_rows, n_cols = tiles_to_lock.shape
-        spawn_overlap_or_above = False
-
+        cells = []
         for r in range(n_rows):
             for c in range(n_cols):
                 if tiles_to_lock[r][c] is not None:
-                    # Calculate grid coordinates relative to the bounded box's bottom-left position
-                    grid_x = blc_position.x + c
-                    grid_y = blc_position.y + (n_rows - 1 - r) # Map matrix row to grid row
-
-                    grid_x_int = int(round(grid_x)) # Ensure integer indices
-                    grid_y_int = int(round(grid_y))
-
-                    if self.is_inside(grid_y_int, grid_x_int):
-                        if self.tile_matrix[grid_y_int][grid_x_int] is not None:
-                            spawn_overlap_or_above = True
-                            break
-                        # Deepcopy the tile (as in first version)
-                        self.tile_matrix[grid_y_int][grid_x_int] = cp.deepcopy(tiles_to_lock[r][c])
-                    else:
-                        # Check if trying to lock above the grid
-                        if grid_y_int >= self.grid_height:
-                            spawn_overlap_or_above = True
-                            break
-                        # Ignore tiles locking outside other bounds
-            if spawn_overlap_or_above: # Exit outer loop if overlap found
-                 break
+                    grid_x_int = int(round(blc_position.x + c)) # Ensure integer indices
+                    grid_y_int = int(round(blc_position.y + (n_rows - 1 - r))) # Map matrix row to grid row
+                    cells.append((grid_y_int, grid_x_int, number_to_exponent(tiles_to_lock[r][c].number)))
+        return self._lock_cells(cells)
+
+    # A method for locking the given tetromino onto the grid at its current
+    # position, followed by the same processing as in update_grid
+    def lock_tetromino(self, tetromino):
+        """
+        Locks the tiles of the tetromino straight from its rotation state, so no
+        tile matrix has to be built or copied. Returns the game_over state.
+        """
+        offsets, _ = tetromino.get_rotation_state()
+        x, y = tetromino.bottom_left_cell.x, tetromino.bottom_left_cell.y
+        cells = [(y + dy, x + dx, number_to_exponent(tile.number))
+                 for tile, (dx, dy) in zip(tetromino.tiles, offsets)]
+        # Lock in the same order as update_grid (top row first, left to right)
+        cells.sort(key=lambda cell: (-cell[0], cell[1]))
+        # A resting piece locked on a stable grid leaves no tile floating
+        return self._lock_cells(cells, not tetromino.can_be_moved("down", self))
+
+    # A method for locking the given (row, col, exponent) cells of a piece that
+    # rests on the grid (as the cells of a placements.Placement), followed by
+    # the same processing as in update_grid
+    def lock_cells(self, cells):
+        # Lock in the same order as update_grid (top row first, left to right)
+        cells = sorted(cells, key=lambda cell: (-cell[0], cell[1]))
+        return self._lock_cells(cells, grid_is_stable=True)
+
+    # Helper method for update_grid and lock_tetromino
+    def _lock_cells(self, cells, grid_is_stable=False):
+        """
+        Locks the given (row, col, exponent) cells onto the grid, checks for game
+        over, then handles merges, line clears and falling tiles until stable.
+        Set grid_is_stable if no tile is floating after the cells are locked.
+        Returns the game_over state.
+        """
+        # Lock the tiles onto the grid (Adapted from first version)
+        self.current_tetromino = None
+        self.bump_version()
+        spawn_overlap_or_above = False
+
+        for grid_y_int, grid_x_int, exponent in cells:
+            if self.is_inside(grid_y_int, grid_x_int):
+                if self.exponent_matrix[grid_y_int, grid_x_int] != 0:
+                    spawn_overlap_or_above = True
+                    break
+                # Only the exponent of the tile number is stored on the grid
+                self.exponent_matrix[grid_y_int, grid_x_int] = exponent
+                self.board_hash ^= self._cell_keys[grid_y_int][grid_x_int][exponent]
+                # the skyline only changes if the tile is above it
+                if grid_y_int >= self.column_heights[grid_x_int]:
+                    self.column_heights[grid_x_int] = grid_y_int + 1
+            else:
+                # Check if trying to lock above the grid
+                if grid_y_int >= self.grid_height:
+                    spawn_overlap_or_above = True
+                    break
+                # Ignore tiles locking outside other bounds
 
         # Check for immediate game over from locking phase
         if spawn_overlap_or_above:
@@ -390,13 +608,47 @@ class GameGrid:
             # print("Game Over: Piece locked overlapping existing tile or above grid.") # Optional debug
             return self.game_over # Return True for game over
 
-        # --- Post-Placement Processing Loop ---
-        # Continuously process merges, line clears, and falling tiles until grid stabilizes
+        # --- Post-Placement Processing ---
+        self.stabilize(grid_is_stable)
+
+        # Return the final game_over state
+        return self.game_over
+
+    # A method for processing the grid after tiles are locked on it
+    def stabilize(self, grid_is_stable=False):
+        """
+        Continuously processes merges, line clears, and falling tiles until the
+        grid stabilizes. Works in place on the exponent matrix, so it can also
+        be used on a view of a board stored elsewhere.
+        Set grid_is_stable if no tile is floating when it is called.
+        The board hash is updated from the cells changed by the cascade, and
+        the result is reused from (or stored in) cascade_cache if it is set.
+        """
+        cache = self.cascade_cache
+        hash_before = self.board_hash
+        if cache is not None:
+            cached = cache.get(hash_before)
+            if cached is not None:
+                board, heights, self.board_hash, score, lines, merges = cached
+                self.exponent_matrix[:] = np.frombuffer(board, dtype=np.uint8).reshape(
+                    self.grid_height, self.grid_width)
+                self.column_heights = np.frombuffer(heights, dtype=np.uint16).astype(np.int64)
+                self.score += score
+                self.total_lines_cleared += lines
+                self.total_merges += merges
+                return
+        board_before = self.exponent_matrix.copy()
+        counters_before = (self.score, self.total_lines_cleared, self.total_merges)
+        grid_changed = False
+
         while True:
             grid_changed_this_cycle = False
 
             # 1. Check for merges (includes internal falling after each merge)
-            merge_score = self.check_and_merge_tiles()
+            merge_score = self.check_and_merge_tiles(grid_is_stable)
+            # Without a merge, the tiles of an unstable grid still have to settle
+            needs_settle = not grid_is_stable and merge_score == 0
+            grid_is_stable = True # Every later cycle starts on a settled grid
             if merge_score > 0:
                 grid_changed_this_cycle = True
 
@@ -405,18 +657,21 @@ class GameGrid:
             if lines_cleared > 0:
                 grid_changed_this_cycle = True
 
-            # 3. Handle any remaining free tiles (e.g., created by line clears)
-            # Call repeatedly until no more single-step moves occur in a pass
-            fell_in_pass = False
-            while self.handle_free_tiles():
-                fell_in_pass = True
-
-            if fell_in_pass:
+            # 3. Handle any remaining free tiles (created by line clears, as
+            # merges settle the tiles they free themselves)
+            if (needs_settle or lines_cleared > 0) and self.settle_free_tiles():
                 grid_changed_this_cycle = True
 
             # Exit loop if the grid is stable (no changes happened in this full cycle)
             if not grid_changed_this_cycle:
                 break
-
-        # Return the final game_over state
-        return self.game_over
+            grid_changed = True
+
+        if grid_changed:
+            self.board_hash ^= changed_cells_hash(board_before, self.exponent_matrix)
+        if cache is not None:
+            cache.put(hash_before, (self.exponent_matrix.tobytes(),
+                                    self.column_heights.astype(np.uint16).tobytes(),
+                                    self.board_hash, self.score - counters_before[0],
+                                    self.total_lines_cleared - counters_before[1],
+                                    self.total_merges - counters_before[2]))
@@ -0,0 +1,162 @@
+from game_grid import GameGrid  # used for the grid logic (no drawing here)
+from piece_generator import PieceGenerator  # the seeded stream of pieces
+from tetromino import Tetromino  # used for the falling pieces
+
+# The actions accepted by GameSession.step
+ACTIONS = ("left", "right", "rotate", "soft_drop", "hard_drop", "tick")
+
+# The tile number that wins the game
+WIN_NUMBER = 2048
+
+# The version of the game rules, increased whenever a change of the rules or of
+# the piece stream changes the game played for a given seed and given actions
+RULES_VERSION = 1
+
+# A class for the result of a single GameSession step
+class StepResult:
+    def __init__(self, state, score_delta, events):
+        # the game grid after the step (the live grid of the session, not a copy)
+        self.state = state
+        # the score gained in the step
+        self.score_delta = score_delta
+        # the names of the things that happened in the step, in order: "moved",
+        # "rotated", "locked", "merged", "lines_cleared", "won" and "game_over"
+        self.events = events
+
+    # The game is over when no new piece could be spawned or locked
+    @property
+    def game_over(self):
+        return self.state.game_over
+
+
+# A class for playing a game of Tetris 2048 without any display or clock
+class GameSession:
+    """
+    Runs the game logic of play_game on discrete actions: gravity is the
+    "tick" action instead of a timer and nothing is drawn, so pygame is never
+    imported and games can be simulated much faster than real time.
+    A piece locks as soon as it cannot move down after an action, as in
+    play_game, and the next piece is spawned right away.
+    The pieces come from a PieceGenerator, so two sessions with the same
+    seed that get the same actions play exactly the same game.
+    """
+
+    # A constructor for starting a new game on a grid with the given dimensions
+    # (the pieces are random unless a seed is given)
+    def __init__(self, grid_h=20, grid_w=12, seed=None):
+        # set the game grid dimension values used in the Tetromino class
+        Tetromino.grid_height = grid_h
+        Tetromino.grid_width = grid_w
+        self.grid = GameGrid(grid_h, grid_w)
+        self.pieces = PieceGenerator(seed)
+        self.grid.piece_generator = self.pieces
+        # the number of pieces locked on the grid so far
+        self.pieces_placed = 0
+        # the win event is only reported the first time a 2048 tile is made
+        self.won = False
+
+        # Create the very first piece and validate its initial spawn position
+        self._spawn(self.pieces.create_tetromino())
+        if not self.grid.game_over:
+            # If the first piece spawns successfully, create the next piece for the preview
+            self.grid.next_tetromino = self.pieces.create_tetromino()
+
+    # The game is over when no new piece could be spawned or locked
+    @property
+    def game_over(self):
+        return self.grid.game_over
+
+    # A method for capturing the state of the game (see GameGrid.snapshot)
+    def snapshot(self):
+        return self.grid.snapshot(), self.pieces_placed, self.won
+
+    # A method for going back to a state captured by snapshot (for undo and search)
+    def restore(self, snapshot):
+        grid_snapshot, self.pieces_placed, self.won = snapshot
+        self.grid.restore(grid_snapshot)
+
+    # A method for continuing the game of this seed from a position reached
+    # after pieces_placed pieces were locked, with the next piece just spawned
+    def resume(self, board, score, pieces_placed, lines_cleared=0, merges=0, won=False):
+        grid = self.grid
+        grid.set_board(board)
+        grid.score = score
+        grid.total_lines_cleared, grid.total_merges = lines_cleared, merges
+        grid.game_over = False
+        self.pieces_placed, self.won = pieces_placed, won
+        # the current piece is the piece with the index pieces_placed in the stream
+        self.pieces.seek(pieces_placed)
+        self._spawn(self.pieces.create_tetromino())
+        grid.next_tetromino = None
+        if not grid.game_over:
+            grid.next_tetromino = self.pieces.create_tetromino()
+
+    # A method for applying one of the ACTIONS and returning a StepResult
+    def step(self, action):
+        grid = self.grid
+        events = []
+        score_before = grid.score
+        tetromino = grid.current_tetromino
+        if grid.game_over or tetromino is None:
+            return StepResult(grid, 0, events)
+
+        if action in ("left", "right"):
+            if tetromino.move(action, grid):
+                events.append("moved")
+        elif action in ("soft_drop", "tick"):
+            # soft drop and gravity both move the piece down by one row
+            if tetromino.move("down", grid):
+                events.append("moved")
+        elif action == "rotate":
+            if tetromino.rotate(grid):
+                events.append("rotated")
+        elif action == "hard_drop":
+            if tetromino.hard_drop(grid) > 0:
+                events.append("moved")
+        else:
+            raise ValueError("unknown action: " + str(action))
+
+        # Lock the piece once it cannot move down anymore (possibly again for
+        # a piece that spawns resting on the tiles below it)
+        while grid.current_tetromino is not None and \
+              not grid.current_tetromino.can_be_moved("down", grid):
+            self._lock(events)
+
+        return StepResult(grid, grid.score - score_before, events)
+
+    # Helper method for step: locks the current piece and spawns the next one
+    def _lock(self, events):
+        grid = self.grid
+        lines_before, merges_before = grid.total_lines_cleared, grid.total_merges
+        # lock_tetromino handles locking & checking game over due to overlap
+        grid.lock_tetromino(grid.current_tetromino)
+        self.pieces_placed += 1
+        events.append("locked")
+        if grid.total_merges > merges_before:
+            events.append("merged")
+        if grid.total_lines_cleared > lines_before:
+            events.append("lines_cleared")
+        if not self.won and grid.max_tile_number() >= WIN_NUMBER:
+            self.won = True
+            events.append("won")
+
+        if grid.game_over:
+            grid.current_tetromino = None # Clear current piece on game over
+            grid.next_tetromino = None # Also clear next piece display
+        else:
+            # The piece previously in 'next' becomes the 'current' one
+            self._spawn(grid.next_tetromino)
+            if not grid.game_over:
+                grid.next_tetromino = self.pieces.create_tetromino()
+        if grid.game_over:
+            events.append("game_over")
+
+    # Helper method: makes the given piece the current one if it can spawn
+    def _spawn(self, tetromino):
+        grid = self.grid
+        grid.current_tetromino = tetromino
+        # Check if the piece can actually spawn at its default location
+        if not tetromino.can_be_moved("down", grid, check_initial=True):
+            grid.game_over = True
+            grid.current_tetromino = None # Clear the invalid current piece
+            grid.next_tetromino = None # Clear next display too
@@ -0,0 +1,65 @@
+from tetromino import Tetromino, SHAPES  # used for creating the pieces
+import numpy as np  # fundamental Python module for scientific computing
+
+# The tetromino types in the order of the type indexes drawn by the generator
+PIECE_TYPES = tuple(SHAPES)
+
+# The number of pieces generated at once (part of the definition of the stream)
+BLOCK_SIZE = 256
+
+# The probability that a tile of a piece is a 2 (it is a 4 otherwise)
+TWO_PROBABILITY = 0.9
+
+
+# A class for the seeded stream of pieces of a game
+class PieceGenerator:
+    """
+    Produces the types and tile numbers of the pieces of one game from a
+    seed. The pieces are generated in blocks of BLOCK_SIZE with NumPy, each
+    block from its own generator seeded by (seed, block index), so the same
+    seed always gives the same stream of pieces and any position of the
+    stream can be reached without generating the pieces before it.
+    Each piece type is equally likely and each tile number is 2 with a
+    probability of 90% and 4 otherwise.
+    """
+
+    # A constructor for the stream of the given seed (a random one by default)
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        self._block_index = None
+        self.seek(0)
+
+    # The number of pieces drawn from the stream so far
+    @property
+    def position(self):
+        return self._block_index * BLOCK_SIZE + self._index
+
+    # A method for continuing the stream at the given position
+    def seek(self, position):
+        block_index, self._index = divmod(position, BLOCK_SIZE)
+        if block_index != self._block_index:
+            self._load_block(block_index)
+
+    # Helper method: generates the pieces of the given block
+    def _load_block(self, block_index):
+        rng = np.random.default_rng([self.seed, block_index])
+        self._types = rng.integers(0, len(PIECE_TYPES), BLOCK_SIZE).tolist()
+        numbers = np.where(rng.random((BLOCK_SIZE, 4)) < TWO_PROBABILITY, 2, 4)
+        self._numbers = numbers.tolist()
+        self._block_index = block_index
+
+    # A method for drawing the type and the four tile numbers of the next piece
+    def next_piece(self):
+        if self._index == BLOCK_SIZE:
+            self._load_block(self._block_index + 1)
+            self._index = 0
+        index = self._index
+        self._index += 1
+        return PIECE_TYPES[self._types[index]], self._numbers[index]
+
+    # A method for creating the next piece as a tetromino
+    def create_tetromino(self):
+        shape, numbers = self.next_piece()
+        return Tetromino(shape, numbers)
@@ -0,0 +1,222 @@
+"""
+placements.py
+
+Finds every place where a tetromino can come to rest on a game grid with
+the moves of the game (left, right, rotate and soft drop, a piece locking
+as soon as it cannot move down), together with the actions that take it
+there. The search is a breadth-first search over the (x, y, rotation)
+states of the piece. The states are not tried by moving the tetromino:
+the rows of the grid are kept as bitmasks and the states where the piece
+fits in a row are found for all x at once from the footprints of the
+rotation states, so that each step of the search handles a whole row of
+states with a few integer operations.
+"""
+
+import numpy as np
+
+from tetromino import ROTATION_STATES
+from tile import number_to_exponent
+
+# The bit of x in the row bitmasks is x + _X_SHIFT, so that the pieces whose
+# tile matrix sticks out on the left of the grid (negative x) still have a bit
+_X_SHIFT = 3
+# Extra bits on the right of the grid for the tile matrices sticking out there
+_RIGHT_MARGIN = 4
+
+#-----------------------------------------------------------------------
+
+class Placement:
+    """
+    A resting place of a tetromino: its rotation state, the position of its
+    bottom left cell, the (row, col, exponent) cells of its four tiles (in
+    the order of the tiles) and the actions (names of game_session.ACTIONS)
+    that take the piece there from its position when the search started.
+    The piece locks right after the last action. The actions are only worked
+    out when they are first asked for, as most placements are only scored.
+    """
+
+    def __init__(self, rotation, x, y, cells, found):
+        self.rotation = rotation
+        self.x = x
+        self.y = y
+        self.cells = cells
+        # the states found by the search, for working out the actions
+        self._found = found
+        self._actions = None
+
+    @property
+    def actions(self):
+        if self._actions is None:
+            self._actions = _actions_to(self._found, self.rotation, self.x, self.y)
+        return self._actions
+
+    def __repr__(self):
+        return (f"Placement(rotation={self.rotation}, x={self.x}, y={self.y}, "
+                f"actions={self.actions})")
+
+#-----------------------------------------------------------------------
+
+def _row_bitmasks(game_grid, lowest_row, highest_row):
+    """
+    Return the bitmasks of the blocked cells of the rows lowest_row to
+    highest_row of game_grid as a uint64 array (the cells outside the grid
+    are blocked, except above it), so grids can be up to 57 columns wide.
+    """
+    height, width = game_grid.grid_height, game_grid.grid_width
+    all_bits = (1 << (width + _X_SHIFT + _RIGHT_MARGIN)) - 1
+    walls = all_bits ^ (((1 << width) - 1) << _X_SHIFT)
+    occupied = game_grid.exponent_matrix != 0
+    # the bit of each column, summed over the occupied cells of each row
+    rows = occupied.astype(np.uint64) @ (np.uint64(1) << np.arange(
+        _X_SHIFT, width + _X_SHIFT, dtype=np.uint64))
+    blocked = np.full(highest_row - lowest_row + 1, walls, dtype=np.uint64)
+    blocked[:max(0, -lowest_row)] = all_bits
+    inside = slice(max(0, lowest_row), min(height, highest_row + 1))
+    blocked[inside.start - lowest_row:inside.stop - lowest_row] |= rows[inside]
+    return blocked
+
+def find_placements(game_grid, tetromino):
+    """
+    Return a list with a Placement for each distinct way the tetromino can
+    come to rest on game_grid, starting from its current position and
+    rotation (the grid and the tetromino are not changed). Placements that
+    lock the same tile numbers on the same cells are only listed once.
+    The list is empty if the tetromino does not fit where it is (as when a
+    piece cannot spawn).
+    """
+    height, width = game_grid.grid_height, game_grid.grid_width
+    states = ROTATION_STATES[tetromino.type]
+    # the bits of all x (the tile matrix may stick out on the left of the grid)
+    x_bits = (1 << (width + _X_SHIFT)) - 1
+    start_rotation = tetromino.rotation
+    start_x, start_y = tetromino.bottom_left_cell.x, tetromino.bottom_left_cell.y
+    # O does not rotate, so its other rotation states are never reached
+    rotations = [start_rotation] if tetromino.type == 'O' else [0, 1, 2, 3]
+    lowest_y = -max(bounds[1] for _, bounds in states)
+
+    # fits[rotation][y - base] is the bitmask of the x where the piece fits
+    # with the given rotation at the given y, from the footprints of the
+    # rotation states (a few integer operations per row)
+    base = lowest_y - 1
+    blocked = _row_bitmasks(game_grid, base, start_y + 3)
+    n_rows = start_y + 1 - base
+    fits = [[0] * n_rows] * 4
+    for rotation in rotations:
+        mask = np.zeros(n_rows, dtype=np.uint64)
+        for dx, dy in states[rotation][0]:
+            mask |= blocked[dy:dy + n_rows] >> np.uint64(dx)
+        fits[rotation] = (~mask & np.uint64(x_bits)).tolist()
+    if not fits[start_rotation][start_y - base] >> (start_x + _X_SHIFT) & 1:
+        return []
+    # a rotated piece must also be inside the grid
+    rotation_tops = [height - 1 - bounds[3] for _, bounds in states]
+    lowest_top = min(rotation_tops)
+
+    # found[rotation, y] lists (new states, action) in the order the states
+    # were reached, the action leading to them from the states found before
+    found = {}
+    resting_states = []
+    falling = None # the states of the previous row that can move down
+    for y in range(start_y, lowest_y - 1, -1):
+        i = y - base
+        if y == start_y:
+            reached = [0] * 4
+            reached[start_rotation] = 1 << (start_x + _X_SHIFT)
+            found[start_rotation, y] = [(reached[start_rotation], None)]
+        else:
+            reached_above = reached
+            reached = [falling[rotation] & fits[rotation][i] for rotation in range(4)]
+            if not any(reached):
+                break
+            for rotation in rotations:
+                if reached[rotation]:
+                    found[rotation, y] = [(reached[rotation], "soft_drop")]
+        # the states that rest on something (the piece locks in these)
+        resting = [fits[rotation][i] & ~fits[rotation][i - 1] for rotation in range(4)]
+
+        # Breadth-first search within the row by horizontal moves and rotations,
+        # skipped when the row is the same as the row above and all states of
+        # the row above fell into it (as in the free space above the tiles)
+        frontier = reached[:]
+        if y != start_y and y < lowest_top and reached == reached_above and \
+           all(fits[rotation][i] == fits[rotation][i + 1] for rotation in rotations):
+            frontier = None
+        while frontier:
+            next_frontier = [0] * 4
+            for rotation in rotations:
+                movable = frontier[rotation] & ~resting[rotation]
+                if not movable:
+                    continue
+                fitting = fits[rotation][i]
+                moves = [("left", rotation, (movable >> 1) & fitting),
+                         ("right", rotation, (movable << 1) & fitting)]
+                if len(rotations) > 1:
+                    rotated = (rotation + 1) % 4
+                    if y <= rotation_tops[rotated]:
+                        moves.append(("rotate", rotated, movable & fits[rotated][i]))
+                for action, new_rotation, new in moves:
+                    new &= ~reached[new_rotation]
+                    if new:
+                        reached[new_rotation] |= new
+                        next_frontier[new_rotation] |= new
+                        found.setdefault((new_rotation, y), []).append((new, action))
+            if not any(next_frontier):
+                break
+            frontier = next_frontier
+
+        falling = [reached[rotation] & ~resting[rotation] for rotation in range(4)]
+        for rotation in rotations:
+            rest = reached[rotation] & resting[rotation]
+            while rest:
+                bit = rest & -rest
+                rest ^= bit
+                resting_states.append((rotation, bit.bit_length() - 1 - _X_SHIFT, y))
+
+    # The rotation states that lock the same tile numbers on the same cells
+    # (relative to their bounding boxes) get the same shape id
+    exponents = [number_to_exponent(tile.number) for tile in tetromino.tiles]
+    footprints, shape_ids, shapes = [], [], {}
+    for offsets, (min_dx, min_dy, _, _) in states:
+        footprint = tuple((dy, dx, exponent) for (dx, dy), exponent in zip(offsets, exponents))
+        footprints.append(footprint)
+        shape = tuple(sorted((dy - min_dy, dx - min_dx, exponent) for dy, dx, exponent in footprint))
+        shape_ids.append(shapes.setdefault(shape, len(shapes)))
+
+    placements = []
+    seen = set()
+    for rotation, x, y in resting_states:
+        min_dx, min_dy = states[rotation][1][:2]
+        key = (shape_ids[rotation], x + min_dx, y + min_dy)
+        if key not in seen:
+            seen.add(key)
+            cells = tuple((y + dy, x + dx, exponent) for dy, dx, exponent in footprints[rotation])
+            placements.append(Placement(rotation, x, y, cells, found))
+    return placements
+
+def _actions_to(found, rotation, x, y):
+    """
+    Return the actions that reach the state (rotation, x, y) by walking back
+    through the found states. The soft drops at the end are replaced by a
+    hard drop, which ends in the same place.
+    """
+    actions = []
+    while True:
+        bit = 1 << (x + _X_SHIFT)
+        action = next(action for mask, action in found[rotation, y] if mask & bit)
+        if action is None:
+            break
+        actions.append(action)
+        if action == "soft_drop":
+            y += 1
+        elif action == "left":
+            x += 1
+        elif action == "right":
+            x -= 1
+        else:
+            rotation = (rotation - 1) % 4
+    actions.reverse()
+    if actions and actions[-1] == "soft_drop":
+        while actions and actions[-1] == "soft_drop":
+            actions.pop()
+        actions.append("hard_drop")
+    return actions
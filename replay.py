@@ -0,0 +1,273 @@
+"""
+replay.py
+
+Records games of Tetris 2048 as compact binary replays and plays them back
+headlessly. A replay holds the seed of the piece stream, the grid size and
+the rules version of GameSession followed by the actions of the game, so
+playing the actions again on a GameSession with the same seed reproduces
+the game exactly.
+
+File layout (all integers are unsigned LEB128 varints):
+
+    header:   MAGIC, format version, rules version, grid height, grid width,
+              keyframe interval, seed
+    records:  one byte per action, the action index (see ACTIONS) in the low
+              3 bits and the number of frames since the previous record in
+              the high 5 bits (31 means that a varint with the rest follows)
+    keyframe: a record with the code KEYFRAME_CODE and no frame delta,
+              followed by the pieces placed, score, lines cleared, merges,
+              won flag and the zlib compressed board (length first); it is
+              written after every keyframe_interval-th locked piece
+
+The keyframes let ReplayReader.seek jump close to any piece index and play
+only the few actions after the keyframe.
+"""
+
+import bisect
+import queue
+import threading
+import zlib
+
+import numpy as np
+
+from game_session import GameSession, ACTIONS, RULES_VERSION
+
+MAGIC = b"T2048R"
+FORMAT_VERSION = 1
+
+# The record code that marks a keyframe (the actions use the codes 0 to 5)
+KEYFRAME_CODE = 7
+# The largest frame delta stored in the record byte itself
+_MAX_SHORT_DELTA = 31
+
+# Locked pieces between two keyframes
+KEYFRAME_INTERVAL = 50
+
+# The file name extension of replays
+REPLAY_EXTENSION = ".t2048"
+
+_ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+
+#-----------------------------------------------------------------------
+
+def _write_varint(out, value):
+    """
+    Append the non-negative integer value to the bytearray out as a varint.
+    """
+    if value < 0:
+        raise ValueError("cannot encode a negative number: " + str(value))
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, pos):
+    """
+    Return the varint at index pos of data and the index after it.
+    """
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+#-----------------------------------------------------------------------
+
+# A class for recording a game to a replay file
+class ReplayWriter:
+    """
+    Writes the replay of a game to path, which must not exist yet (a replay
+    is never overwritten, FileExistsError is raised instead). The records
+    are encoded in the calling thread (a few bytes each) and written to the
+    file by a background thread, so recording never waits for the disk.
+    Call close (or use the writer in a with statement) to write the rest of
+    the file.
+    """
+
+    # A constructor for starting the replay of a game with the given seed and grid size
+    def __init__(self, path, seed, grid_h, grid_w, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self._last_frame = 0
+        self._last_keyframe = 0
+        header = bytearray(MAGIC)
+        for value in (FORMAT_VERSION, RULES_VERSION, grid_h, grid_w, keyframe_interval, seed):
+            _write_varint(header, value)
+
+        self._file = open(path, "xb")
+        self._chunks = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._write_chunks, daemon=True)
+        self._thread.start()
+        self._chunks.put(bytes(header))
+
+    # Helper method: the body of the writer thread
+    def _write_chunks(self):
+        try:
+            for chunk in iter(self._chunks.get, None):
+                self._file.write(chunk)
+        except OSError as error:
+            self._error = error
+        finally:
+            self._file.close()
+
+    # A method for recording an action taken in the given frame
+    def record(self, frame, action, session=None):
+        """
+        Records that action was applied in frame (frames never decrease).
+        Pass the session after the step to write the keyframes.
+        """
+        delta = frame - self._last_frame
+        if delta < 0:
+            raise ValueError("frames must not decrease")
+        self._last_frame = frame
+        record = bytearray()
+        record.append(_ACTION_CODES[action] | min(delta, _MAX_SHORT_DELTA) << 3)
+        if delta >= _MAX_SHORT_DELTA:
+            _write_varint(record, delta - _MAX_SHORT_DELTA)
+        if session is not None and not session.game_over and \
+           session.pieces_placed >= self._last_keyframe + self.keyframe_interval:
+            self._add_keyframe(record, session)
+        self._chunks.put(bytes(record))
+
+    # Helper method: appends a keyframe of the session to record
+    def _add_keyframe(self, record, session):
+        grid = session.grid
+        self._last_keyframe = session.pieces_placed
+        record.append(KEYFRAME_CODE)
+        for value in (session.pieces_placed, grid.score, grid.total_lines_cleared,
+                      grid.total_merges, int(session.won)):
+            _write_varint(record, value)
+        board = zlib.compress(grid.exponent_matrix.tobytes())
+        _write_varint(record, len(board))
+        record += board
+
+    # A method for writing the rest of the replay and closing the file
+    def close(self):
+        if self._thread.is_alive():
+            self._chunks.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# A class for the state of a game stored in a keyframe of a replay
+class Keyframe:
+    def __init__(self, record_index, frame, pieces_placed, score,
+                 lines_cleared, merges, won, board):
+        # the number of action records before the keyframe
+        self.record_index = record_index
+        self.frame = frame
+        self.pieces_placed = pieces_placed
+        self.score = score
+        self.lines_cleared = lines_cleared
+        self.merges = merges
+        self.won = won
+        # the zlib compressed bytes of the exponent matrix
+        self.board = board
+
+
+# A class for playing back a replay file
+class ReplayReader:
+    """
+    Reads the replay at path. The actions and the frames they were taken in
+    are in the lists actions and frames, the keyframes in keyframes.
+    """
+
+    # A constructor for reading the replay at the given path
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a Tetris 2048 replay")
+        pos = len(MAGIC)
+        header = []
+        for _ in range(6):
+            value, pos = _read_varint(data, pos)
+            header.append(value)
+        (format_version, self.rules_version, self.grid_height, self.grid_width,
+         self.keyframe_interval, self.seed) = header
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"unsupported replay format version {format_version}")
+        if self.rules_version != RULES_VERSION:
+            raise ValueError(f"the replay was recorded with the rules version "
+                             f"{self.rules_version}, not {RULES_VERSION}")
+
+        self.actions, self.frames, self.keyframes = [], [], []
+        frame = 0
+        while pos < len(data):
+            code = data[pos] & 0x07
+            delta = data[pos] >> 3
+            pos += 1
+            if code == KEYFRAME_CODE:
+                values = []
+                for _ in range(6):
+                    value, pos = _read_varint(data, pos)
+                    values.append(value)
+                board = data[pos:pos + values[-1]]
+                pos += values[-1]
+                self.keyframes.append(Keyframe(len(self.actions), frame,
+                                               *values[:4], bool(values[4]), board))
+                continue
+            if delta == _MAX_SHORT_DELTA:
+                rest, pos = _read_varint(data, pos)
+                delta += rest
+            frame += delta
+            self.actions.append(ACTIONS[code])
+            self.frames.append(frame)
+        self._keyframe_pieces = [keyframe.pieces_placed for keyframe in self.keyframes]
+
+    # A method for creating a new session of the game of the replay
+    def new_session(self):
+        return GameSession(self.grid_height, self.grid_width, seed=self.seed)
+
+    # A method for playing the actions of the replay as fast as possible
+    def replay(self, session=None, start=0, stop=None):
+        """
+        Applies the actions with the indexes start to stop (all by default)
+        to session (a new session by default) and returns the session.
+        """
+        if session is None:
+            session = self.new_session()
+        step = session.step
+        for action in self.actions[start:stop]:
+            step(action)
+        return session
+
+    # A method for restoring the game at a keyframe
+    def session_at_keyframe(self, keyframe):
+        session = self.new_session()
+        board = np.frombuffer(zlib.decompress(keyframe.board), dtype=np.uint8)
+        session.resume(board.reshape(self.grid_height, self.grid_width), keyframe.score,
+                       keyframe.pieces_placed, keyframe.lines_cleared,
+                       keyframe.merges, keyframe.won)
+        return session
+
+    # A method for going to the moment the piece with the given index spawned
+    def seek(self, piece_index):
+        """
+        Returns (session, record_index): the session right after piece_index
+        pieces were locked (or at the end of the replay if the game has fewer
+        pieces) and the index of the next action to apply. Starts from the
+        last keyframe at or before piece_index.
+        """
+        keyframe_index = bisect.bisect_right(self._keyframe_pieces, piece_index) - 1
+        if keyframe_index >= 0:
+            keyframe = self.keyframes[keyframe_index]
+            session, record_index = self.session_at_keyframe(keyframe), keyframe.record_index
+        else:
+            session, record_index = self.new_session(), 0
+        step = session.step
+        while session.pieces_placed < piece_index and not session.game_over and \
+              record_index < len(self.actions):
+            step(self.actions[record_index])
+            record_index += 1
+        return session, record_index
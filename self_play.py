@@ -0,0 +1,229 @@
+"""
+self_play.py
+
+Plays many complete games of Tetris 2048 in parallel with headless game
+sessions driven by a policy, and prints throughput and score statistics.
+Run it from the command line, for example:
+
+    python3 self_play.py --games 1000 --policy random_drops
+
+A policy is given by the name of one of the POLICIES below, or as
+"module:function" for a policy factory defined elsewhere. A policy factory
+takes a random.Random and returns a function that maps a GameSession to the
+next action (one of game_session.ACTIONS).
+"""
+
+import argparse
+import importlib
+import multiprocessing
+import os
+import queue
+import random
+import statistics
+import time
+import traceback
+
+from ai_player import ai_policy
+from game_session import GameSession, ACTIONS
+
+#-----------------------------------------------------------------------
+
+# Built-in policies
+
+def random_actions(rng):
+    """
+    Return a policy that chooses every action uniformly at random.
+    """
+    return lambda session: rng.choice(ACTIONS)
+
+def random_drops(rng):
+    """
+    Return a policy that rotates and shifts each piece a random amount,
+    then hard drops it.
+    """
+    plan = []
+    planned_piece = [None]
+
+    def policy(session):
+        piece = session.grid.current_tetromino
+        if piece is not planned_piece[0] or not plan:
+            planned_piece[0] = piece
+            plan[:] = ["rotate"] * rng.randint(0, 3)
+            plan.extend([rng.choice(("left", "right"))] * rng.randint(0, session.grid.grid_width // 2))
+            plan.append("hard_drop")
+        return plan.pop(0)
+
+    return policy
+
+POLICIES = {
+    "random_actions": random_actions,
+    "random_drops": random_drops,
+    "ai": ai_policy,
+}
+
+def load_policy(spec):
+    """
+    Return the policy factory named by spec, either a key of POLICIES or
+    "module:function".
+    """
+    if spec in POLICIES:
+        return POLICIES[spec]
+    module_name, _, function_name = spec.partition(":")
+    if not function_name:
+        raise ValueError("unknown policy: " + spec)
+    return getattr(importlib.import_module(module_name), function_name)
+
+#-----------------------------------------------------------------------
+
+def play_one_game(policy_factory, seed, grid_h, grid_w, max_steps):
+    """
+    Play one game with a policy made by policy_factory and return its
+    statistics as a dict.
+    """
+    session = GameSession(grid_h, grid_w, seed=seed)
+    policy = policy_factory(random.Random(seed))
+    steps = 0
+    while not session.game_over and steps < max_steps:
+        session.step(policy(session))
+        steps += 1
+    grid = session.grid
+    return {
+        "seed": seed,
+        "score": grid.score,
+        "max_tile": grid.max_tile_number(),
+        "pieces_placed": session.pieces_placed,
+        "lines_cleared": grid.total_lines_cleared,
+        "merges": grid.total_merges,
+        "steps": steps,
+        "finished": session.game_over,
+    }
+
+class SelfPlayError(RuntimeError):
+    """
+    Raised by run_self_play when a worker fails or stops before all games
+    are finished, with the traceback of the worker if it has one.
+    """
+
+def _worker(policy_spec, grid_h, grid_w, max_steps, seeds, results):
+    """
+    Play the games whose seeds arrive on the seeds queue (until a None) and
+    put their statistics on the bounded results queue. An exception is put
+    on the results queue as a SelfPlayError and ends the worker.
+    """
+    seed = None
+    try:
+        policy_factory = load_policy(policy_spec)
+        for seed in iter(seeds.get, None):
+            results.put(play_one_game(policy_factory, seed, grid_h, grid_w, max_steps))
+    except Exception:
+        results.put(SelfPlayError(f"worker failed in the game with seed {seed}:\n"
+                                  + traceback.format_exc()))
+
+def run_self_play(n_games, policy_spec="random_drops", n_workers=None, seed=0,
+                  grid_h=20, grid_w=12, max_steps=100000, queue_size=64):
+    """
+    Play n_games games across n_workers processes (all CPU cores by default)
+    and yield the statistics of each game as soon as it is finished.
+    Raises SelfPlayError if a worker fails or all workers stop early.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    load_policy(policy_spec) # fail early on an unknown policy
+    seeds = multiprocessing.Queue()
+    results = multiprocessing.Queue(maxsize=queue_size)
+    for game_index in range(n_games):
+        seeds.put(seed + game_index)
+    for _ in range(n_workers):
+        seeds.put(None)
+    workers = [multiprocessing.Process(target=_worker, daemon=True,
+                                       args=(policy_spec, grid_h, grid_w, max_steps, seeds, results))
+               for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    finished = 0
+    try:
+        while finished < n_games:
+            # a worker flushes its results before it stops, so they are read first
+            workers_alive = any(worker.is_alive() for worker in workers)
+            try:
+                result = results.get(timeout=1)
+            except queue.Empty:
+                if not workers_alive:
+                    raise SelfPlayError(f"the workers stopped after {finished} of {n_games} games")
+                continue
+            if isinstance(result, SelfPlayError):
+                raise result
+            finished += 1
+            yield result
+    finally:
+        for worker in workers:
+            if finished < n_games:
+                worker.terminate() # the remaining games are not needed
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+
+#-----------------------------------------------------------------------
+
+def _describe(name, values):
+    """
+    Return a line with the mean and the distribution of values.
+    """
+    values = sorted(values)
+    deciles = statistics.quantiles(values, n=10, method="inclusive") if len(values) > 1 else values * 9
+    return (f"{name:>14}: mean {statistics.fmean(values):10.1f}  min {values[0]:8}  "
+            f"p10 {deciles[0]:8.0f}  median {statistics.median(values):8.0f}  "
+            f"p90 {deciles[-1]:8.0f}  max {values[-1]:8}")
+
+def print_summary(games, elapsed_time):
+    """
+    Print the throughput and the distributions of the statistics of games.
+    """
+    n_games = len(games)
+    if n_games == 0:
+        print(f"no games finished in {elapsed_time:.1f} s")
+        return
+    pieces = sum(game["pieces_placed"] for game in games)
+    steps = sum(game["steps"] for game in games)
+    if elapsed_time > 0:
+        print(f"{n_games} games in {elapsed_time:.1f} s: {n_games / elapsed_time:.1f} games/s, "
+              f"{pieces / elapsed_time:.0f} pieces/s, {steps / elapsed_time:.0f} steps/s")
+    else: # too fast for the clock
+        print(f"{n_games} games: {pieces} pieces, {steps} steps")
+    unfinished = sum(not game["finished"] for game in games)
+    if unfinished:
+        print(f"{unfinished} games stopped at the step limit")
+    for name in ("score", "max_tile", "pieces_placed", "lines_cleared", "merges"):
+        print(_describe(name, [game[name] for game in games]))
+    print("max tile counts:")
+    max_tiles = [game["max_tile"] for game in games]
+    for tile in sorted(set(max_tiles)):
+        count = max_tiles.count(tile)
+        print(f"{tile:>14}: {count:6} ({100.0 * count / n_games:5.1f}%)")
+
+def _main():
+    parser = argparse.ArgumentParser(description="Play Tetris 2048 games in parallel with a policy.")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--policy", default="random_drops",
+                        help="one of " + ", ".join(POLICIES) + " or module:function")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--grid-height", type=int, default=20)
+    parser.add_argument("--grid-width", type=int, default=12)
+    parser.add_argument("--max-steps", type=int, default=100000, help="step limit of a game")
+    parser.add_argument("--queue-size", type=int, default=64, help="size of the result queue")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    games = []
+    try:
+        for game in run_self_play(args.games, args.policy, args.workers, args.seed,
+                                  args.grid_height, args.grid_width, args.max_steps, args.queue_size):
+            games.append(game)
+            if len(games) % max(1, args.games // 10) == 0:
+                print(f"{len(games)}/{args.games} games finished")
+    finally:
+        # also summarize the games finished before a worker failed
+        print_summary(games, time.perf_counter() - start_time)
+
+if __name__ == '__main__':
+    _main()
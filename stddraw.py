@@ -10,6 +10,8 @@ commonly used Color objects defined in the color module.
 import time
 import os
 import sys
+import math
+import collections
 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
 import pygame
@@ -83,6 +85,15 @@ _DEFAULT_PEN_COLOR = BLACK
 _DEFAULT_FONT_FAMILY = 'Helvetica'
 _DEFAULT_FONT_SIZE = 12
 
+# The most fonts kept loaded by _getFont.
+_FONT_CACHE_SIZE = 32
+
+# The most rendered texts kept by _renderText.
+_TEXT_CACHE_SIZE = 64
+
+# The color of the transparent pixels of the sprites made by makeSprite.
+_SPRITE_COLORKEY = (255, 0, 255)
+
 _xmin = None
 _ymin = None
 _xmax = None
@@ -91,12 +102,23 @@ _ymax = None
 _fontFamily = _DEFAULT_FONT_FAMILY
 _fontSize = _DEFAULT_FONT_SIZE
 
+# The loaded fonts, keyed by (family, size, bold), least recently used first.
+_fontCache = collections.OrderedDict()
+
+# The rendered texts, keyed by (string, family, size, bold, color), least
+# recently used first.
+_textCache = collections.OrderedDict()
+
 _canvasWidth = float(_DEFAULT_CANVAS_SIZE)
 _canvasHeight = float(_DEFAULT_CANVAS_SIZE)
 _penRadius = None
 _penColor = _DEFAULT_PEN_COLOR
 _keysTyped = []
 
+# The pygame.Rect areas of the canvas marked as changed since the last
+# show (see clearDirty), or None if the whole canvas is to be presented.
+_dirtyRects = None
+
 # Has the window been created?
 _windowCreated = False
 
@@ -118,6 +140,44 @@ _mousePos = None
 
 #-----------------------------------------------------------------------
 
+def _getFont(family, size, bold=False):
+    """
+    Return the pygame font with the given family, size and boldness.
+    Looking up and loading a system font is slow, so the fonts are
+    kept in _fontCache and the least recently used one is dropped
+    when more than _FONT_CACHE_SIZE fonts are loaded.
+    """
+    key = (family, size, bold)
+    font = _fontCache.get(key)
+    if font is None:
+        font = pygame.font.SysFont(family, size, bold)
+        _fontCache[key] = font
+        if len(_fontCache) > _FONT_CACHE_SIZE:
+            _fontCache.popitem(last=False)
+    else:
+        _fontCache.move_to_end(key)
+    return font
+
+def _renderText(s, bold=False):
+    """
+    Return a pygame.Surface with string s rendered in the current font
+    and pen color. The texts drawn on every frame rarely change, so the
+    rendered texts are kept in _textCache and the least recently used
+    one is dropped when more than _TEXT_CACHE_SIZE texts are kept.
+    """
+    key = (s, _fontFamily, _fontSize, bold, _penColor.getRed(),
+           _penColor.getGreen(), _penColor.getBlue())
+    text = _textCache.get(key)
+    if text is None:
+        font = _getFont(_fontFamily, _fontSize, bold)
+        text = font.render(s, 1, _pygameColor(_penColor))
+        _textCache[key] = text
+        if len(_textCache) > _TEXT_CACHE_SIZE:
+            _textCache.popitem(last=False)
+    else:
+        _textCache.move_to_end(key)
+    return text
+
 def _pygameColor(c):
     """
     Convert c, an object of type color.Color, to an equivalent object
@@ -489,8 +549,7 @@ def text(x, y, s):
     y = float(y)
     xs = _scaleX(x)
     ys = _scaleY(y)
-    font = pygame.font.SysFont(_fontFamily, _fontSize)
-    text = font.render(s, 1, _pygameColor(_penColor))
+    text = _renderText(s)
     textpos = text.get_rect(center=(xs, ys))
     _surface.blit(text, textpos)
 
@@ -503,8 +562,7 @@ def boldText(x, y, s):
     y = float(y)
     xs = _scaleX(x)
     ys = _scaleY(y)
-    font = pygame.font.SysFont(_fontFamily, _fontSize, True)
-    text = font.render(s, 1, _pygameColor(_penColor))
+    text = _renderText(s, True)
     textpos = text.get_rect(center=(xs, ys))
     _surface.blit(text, textpos)
 
@@ -530,6 +588,62 @@ def picture(pic, x=None, y=None):
     picSurface = pic._surface # violates encapsulation
     _surface.blit(picSurface, [xs-ws/2.0, ys-hs/2.0, ws, hs])
 
+def pixelSize(w, h):
+    """
+    Return the size (width, height) in whole pixels of a w x h
+    rectangle at the current scale.
+    """
+    return (int(round(_factorX(float(w)))), int(round(_factorY(float(h)))))
+
+def makeSprite(w, h, draw, x=0.0, y=0.0, transparent=False):
+    """
+    Return a pygame.Surface of pixelSize(w, h) with the drawing made
+    by draw(), a function without arguments that draws with the
+    functions of this module on a w x h rectangle centered at (x, y).
+    Blitting the surface with blits draws the same at any place, so
+    drawings that are repeated or never change can be rendered only
+    once. If transparent is True, the pixels that draw() leaves alone
+    are not blitted (this suits shapes more than text, as the edges of
+    text are blended with the background of the sprite).
+    """
+    global _surface
+    global _canvasWidth
+    global _canvasHeight
+    global _xmin
+    global _xmax
+    global _ymin
+    global _ymax
+    _makeSureWindowCreated()
+    saved = (_surface, _canvasWidth, _canvasHeight, _xmin, _xmax, _ymin, _ymax)
+    pw, ph = pixelSize(w, h)
+    sprite = pygame.Surface((pw, ph))
+    if transparent:
+        sprite.fill(_SPRITE_COLORKEY)
+        sprite.set_colorkey(_SPRITE_COLORKEY)
+    _surface = sprite
+    _canvasWidth, _canvasHeight = float(pw), float(ph)
+    _xmin, _xmax = x - w / 2.0, x + w / 2.0
+    _ymin, _ymax = y - h / 2.0, y + h / 2.0
+    try:
+        draw()
+    finally:
+        (_surface, _canvasWidth, _canvasHeight,
+         _xmin, _xmax, _ymin, _ymax) = saved
+    return sprite
+
+def blits(sprites):
+    """
+    Draw on the background canvas each (surface, x, y) of sprites,
+    the pygame.Surface surface (as made by makeSprite) centered at
+    (x, y), with a single Surface.blits call.
+    """
+    _makeSureWindowCreated()
+    _surface.blits(
+        [(sprite, (_scaleX(float(x)) - sprite.get_width() / 2.0,
+                   _scaleY(float(y)) - sprite.get_height() / 2.0))
+         for sprite, x, y in sprites],
+        False)
+
 def clear(c=WHITE):
     """
     Clear the background canvas to color c, where c is an
@@ -558,12 +672,54 @@ def save(f):
 
 #-----------------------------------------------------------------------
 
+def clearDirty():
+    """
+    Mark the whole canvas as unchanged since the last show, so that
+    the next show only copies the areas marked with markDirty to the
+    window canvas, instead of the whole background canvas.
+    """
+    global _dirtyRects
+    _dirtyRects = []
+
+def markDirty(x, y, w, h):
+    """
+    Mark the rectangle of width w and height h whose lower left point
+    is (x, y) as changed since the last show. This has no effect
+    unless clearDirty was called since the last show.
+    """
+    if _dirtyRects is None:
+        return
+    xs = _scaleX(float(x))
+    ys = _scaleY(float(y) + float(h))
+    # Cover the pixels that the rectangle touches, and one more on each side.
+    left = int(math.floor(xs)) - 1
+    top = int(math.floor(ys)) - 1
+    right = int(math.ceil(xs + _factorX(float(w)))) + 1
+    bottom = int(math.ceil(ys + _factorY(float(h)))) + 1
+    _dirtyRects.append(pygame.Rect(left, top, right - left, bottom - top))
+
+def markAllDirty():
+    """
+    Mark the whole canvas as changed, so that the next show copies
+    all of the background canvas to the window canvas.
+    """
+    global _dirtyRects
+    _dirtyRects = None
+
 def _show():
     """
-    Copy the background canvas to the window canvas.
+    Copy the background canvas to the window canvas: all of it, or
+    only the areas marked with markDirty after a call of clearDirty.
     """
-    _background.blit(_surface, (0, 0))
-    pygame.display.flip()
+    global _dirtyRects
+    if _dirtyRects is None:
+        _background.blit(_surface, (0, 0))
+        pygame.display.flip()
+    else:
+        for rect in _dirtyRects:
+            _background.blit(_surface, rect, rect)
+        pygame.display.update(_dirtyRects)
+    _dirtyRects = None
     _checkForEvents()
 
 def _showAndWaitForever():
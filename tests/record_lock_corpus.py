@@ -0,0 +1,118 @@
+"""
+record_lock_corpus.py
+
+Records the corpus of tests/test_lock_corpus.py: random boards (stable
+stacks and boards with floating tiles) with a tetromino to lock on each,
+and the board, score and game over state that GameGrid.update_grid of a
+reference version of the game gives after the lock:
+
+    python3 tests/record_lock_corpus.py <directory of the reference version>
+
+The reference version must be importable from its directory (with lib/)
+and is only run here, the corpus stores plain tile exponents.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lock_corpus.npz")
+# The grid sizes of the corpus and the number of boards of each size
+GRID_SIZES = ((12, 8, 2000), (20, 12, 1000))
+# The cells of the tetromino types in a 4 x 4 box (row, col)
+PIECE_CELLS = (
+    ((0, 0), (0, 1), (0, 2), (0, 3)),  # I
+    ((0, 0), (0, 1), (1, 0), (1, 1)),  # O
+    ((0, 0), (0, 1), (1, 1), (1, 2)),  # Z
+    ((0, 0), (1, 0), (1, 1), (1, 2)),  # J
+    ((0, 2), (1, 0), (1, 1), (1, 2)),  # L
+    ((0, 1), (0, 2), (1, 0), (1, 1)),  # S
+    ((0, 1), (1, 0), (1, 1), (1, 2)),  # T
+)
+
+#-----------------------------------------------------------------------
+
+def random_case(rng, grid_h, grid_w):
+    """
+    Return a random (board, cells) case: a board of tile exponents and the
+    (row, col, exponent) cells of a tetromino on empty cells of the board.
+    Half of the boards are stacks without holes, the other half have random
+    occupied cells, so that some tiles float. Small exponents make merges
+    and merge chains likely.
+    """
+    board = np.zeros((grid_h, grid_w), dtype=np.uint8)
+    max_exponent = int(rng.integers(2, 7))
+    if rng.random() < 0.5:
+        for col in range(grid_w):
+            height = int(rng.integers(0, grid_h * 2 // 3))
+            board[:height, col] = rng.integers(1, max_exponent, height)
+        # Some full rows
+        for row in rng.choice(grid_h // 2, int(rng.integers(0, 3)), replace=False):
+            board[row] = rng.integers(1, max_exponent, grid_w)
+    else:
+        density = rng.random() * 0.6
+        mask = rng.random((grid_h - 4, grid_w)) < density
+        board[:grid_h - 4][mask] = rng.integers(1, max_exponent, int(mask.sum()))
+    while True:
+        shape = PIECE_CELLS[int(rng.integers(len(PIECE_CELLS)))]
+        row = int(rng.integers(0, grid_h - 1))
+        col = int(rng.integers(0, grid_w - 3))
+        cells = [(row + 1 - r, col + c, int(rng.integers(1, max_exponent))) for r, c in shape]
+        if all(board[r, c] == 0 for r, c, _ in cells):
+            return board, cells
+
+def _lock_with_reference(board, cells):
+    """
+    Lock cells on board with GameGrid.update_grid of the reference version
+    (its modules must be importable) and return (board, score, game_over).
+    """
+    from game_grid import GameGrid
+    from point import Point
+    from tile import Tile
+
+    def reference_tile(number):
+        tile = Tile() # the constructor of the reference Tile takes no number
+        tile.update_number_and_color(number)
+        return tile
+
+    grid_h, grid_w = board.shape
+    grid = GameGrid(grid_h, grid_w)
+    for row, col in zip(*np.nonzero(board)):
+        grid.tile_matrix[row, col] = reference_tile(1 << int(board[row, col]))
+    rows = [r for r, _, _ in cells]
+    cols = [c for _, c, _ in cells]
+    n_rows, n_cols = max(rows) - min(rows) + 1, max(cols) - min(cols) + 1
+    tiles = np.full((n_rows, n_cols), None, dtype=object)
+    for r, c, exponent in cells:
+        tiles[max(rows) - r, c - min(cols)] = reference_tile(1 << exponent)
+    grid.update_grid(tiles, Point(min(cols), min(rows)))
+    after = np.zeros_like(board)
+    for row, col in zip(*np.nonzero(grid.tile_matrix != None)):
+        after[row, col] = int(grid.tile_matrix[row, col].number).bit_length() - 1
+    return after, grid.score, grid.game_over
+
+def record(reference_dir, seed=2048):
+    sys.path.insert(0, reference_dir)
+    rng = np.random.default_rng(seed)
+    arrays = {}
+    for grid_h, grid_w, n_cases in GRID_SIZES:
+        boards, pieces, after, scores, game_over = [], [], [], [], []
+        for _ in range(n_cases):
+            board, cells = random_case(rng, grid_h, grid_w)
+            result = _lock_with_reference(board.copy(), cells)
+            boards.append(board)
+            pieces.append(cells)
+            after.append(result[0])
+            scores.append(result[1])
+            game_over.append(result[2])
+        prefix = f"{grid_h}x{grid_w}_"
+        arrays[prefix + "boards"] = np.array(boards)
+        arrays[prefix + "pieces"] = np.array(pieces, dtype=np.int16)
+        arrays[prefix + "boards_after"] = np.array(after)
+        arrays[prefix + "scores"] = np.array(scores, dtype=np.int64)
+        arrays[prefix + "game_over"] = np.array(game_over)
+    np.savez_compressed(CORPUS_FILE, **arrays)
+
+if __name__ == '__main__':
+    record(sys.argv[1])
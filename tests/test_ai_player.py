@@ -0,0 +1,70 @@
+"""
+Tests of ai_player.py and placements.py on near-full boards.
+"""
+
+import numpy as np
+
+from ai_player import AIPlayer
+from game_grid import GameGrid
+from game_session import GameSession
+from placements import find_placements
+
+
+def near_full_sessions(n_boards, grid_h=8, grid_w=6, seed=0):
+    """
+    Yield sessions with random stacks that reach up to the spawn rows and
+    a current piece that still fits, so that many placements leave no room
+    for the next piece to spawn.
+    """
+    rng = np.random.default_rng(seed)
+    for game_seed in range(n_boards):
+        session = GameSession(grid_h, grid_w, seed=game_seed)
+        board = np.zeros((grid_h, grid_w), dtype=np.uint8)
+        for col in range(grid_w):
+            height = int(rng.integers(grid_h - 5, grid_h - 1))
+            board[:height, col] = rng.integers(1, 8, height)
+        session.grid.set_board(board)
+        if find_placements(session.grid, session.grid.current_tetromino):
+            yield session
+
+
+def next_piece_blocked(grid, placement):
+    """
+    Return whether the next piece of grid cannot spawn after placement.
+    """
+    after = GameGrid(grid.grid_height, grid.grid_width)
+    after.set_board(grid.exponent_matrix)
+    after.lock_cells(placement.cells)
+    return not after.game_over and not find_placements(after, grid.next_tetromino)
+
+
+def test_find_placements_of_a_piece_that_does_not_fit():
+    # only the top row is full, a piece that spawns on it would fit lower down
+    board = np.zeros((8, 6), dtype=np.uint8)
+    board[-1] = 1
+    blocked_pieces = 0
+    for seed in range(20):
+        session = GameSession(8, 6, seed=seed)
+        session.grid.set_board(board)
+        piece = session.grid.current_tetromino
+        offsets, _ = piece.get_rotation_state()
+        x, y = piece.bottom_left_cell.x, piece.bottom_left_cell.y
+        if any(board[y + dy, x + dx] for dx, dy in offsets):
+            blocked_pieces += 1
+            assert find_placements(session.grid, piece) == []
+    assert blocked_pieces > 0
+
+
+def test_choose_placement_when_the_next_piece_cannot_spawn():
+    player = AIPlayer(time_budget=None, max_depth=2)
+    blocked_boards = 0
+    for session in near_full_sessions(100):
+        grid = session.grid
+        board_before = grid.exponent_matrix.copy()
+        placement = player.choose_placement(grid)
+        assert placement is not None
+        assert (grid.exponent_matrix == board_before).all()
+        blocked_boards += any(next_piece_blocked(grid, other)
+                              for other in find_placements(grid, grid.current_tetromino))
+    # the boards must include the case that used to crash the search
+    assert blocked_boards > 0
@@ -0,0 +1,37 @@
+"""
+Tests of dataset.py: a failing writer thread is reported instead of
+blocking, and a failed generation writes no index.
+"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from dataset import DatasetWriter, INDEX_FILE, generate, open_shards
+
+
+def test_generate_writes_every_record(tmp_path):
+    n_records = generate(tmp_path, 2, grid_h=12, grid_w=8, shard_size=100)
+    assert sum(len(shard) for shard in open_shards(tmp_path)) == n_records
+
+
+def test_add_raises_when_the_writer_thread_fails(tmp_path, monkeypatch):
+    def fail():
+        time.sleep(0.2) # fails once the queue is full
+        raise OSError("no space left")
+    writer = DatasetWriter(tmp_path, 12, 8, shard_size=10)
+    monkeypatch.setattr(writer, "_open_shard", fail)
+    with pytest.raises(OSError):
+        # more chunks than the queue holds, so add would wait forever on a full queue
+        for _ in range(100):
+            writer.add(np.zeros(5, dtype=writer.dtype))
+
+
+def test_no_index_after_an_error(tmp_path):
+    with pytest.raises(KeyError):
+        with DatasetWriter(tmp_path, 12, 8, shard_size=10) as writer:
+            writer.add(np.zeros(5, dtype=writer.dtype))
+            raise KeyError("policy failed")
+    assert not os.path.exists(os.path.join(tmp_path, INDEX_FILE))
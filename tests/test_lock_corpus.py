@@ -0,0 +1,66 @@
+"""
+Tests GameGrid.update_grid against the corpus of locks recorded from the
+first version of the game by record_lock_corpus.py: the board, score and
+game over state after every lock must be the same. Also tests that the
+column heights of tall grids survive a restore and the cascade cache.
+"""
+
+import numpy as np
+import pytest
+
+from game_grid import GameGrid
+from point import Point
+from tile import get_tile
+from zobrist import TranspositionTable, board_hash
+
+from record_lock_corpus import CORPUS_FILE, GRID_SIZES
+
+
+def tile_matrix(cells):
+    """
+    Return the tile matrix and the bottom left position of the given
+    (row, col, exponent) cells, as update_grid takes them.
+    """
+    rows = [row for row, _, _ in cells]
+    cols = [col for _, col, _ in cells]
+    tiles = np.full((max(rows) - min(rows) + 1, max(cols) - min(cols) + 1), None, dtype=object)
+    for row, col, exponent in cells:
+        tiles[max(rows) - row, col - min(cols)] = get_tile(1 << int(exponent))
+    return tiles, Point(min(cols), min(rows))
+
+
+@pytest.mark.parametrize("grid_h, grid_w", [(grid_h, grid_w) for grid_h, grid_w, _ in GRID_SIZES])
+def test_update_grid_matches_the_recorded_locks(grid_h, grid_w):
+    corpus = np.load(CORPUS_FILE)
+    prefix = f"{grid_h}x{grid_w}_"
+    cases = zip(corpus[prefix + "boards"], corpus[prefix + "pieces"], corpus[prefix + "boards_after"],
+                corpus[prefix + "scores"], corpus[prefix + "game_over"])
+    mismatches = []
+    for case_index, (board, cells, board_after, score, game_over) in enumerate(cases):
+        grid = GameGrid(grid_h, grid_w)
+        grid.set_board(board)
+        grid.update_grid(*tile_matrix(cells))
+        if not ((grid.exponent_matrix == board_after).all() and grid.score == score and
+                grid.game_over == game_over):
+            mismatches.append(case_index)
+        elif not game_over:
+            assert grid.board_hash == board_hash(grid.exponent_matrix)
+    assert mismatches == []
+
+
+def test_column_heights_above_255_survive_a_restore_and_the_cascade_cache():
+    board = np.zeros((300, 4), dtype=np.uint8)
+    board[:280, 0] = np.arange(280) % 2 + 1 # alternate 2s and 4s, nothing merges
+    grid = GameGrid(300, 4)
+    grid.set_board(board)
+    snapshot = grid.snapshot()
+    grid.set_board(np.zeros_like(board))
+    grid.restore(snapshot)
+    assert grid.column_heights.tolist() == [280, 0, 0, 0]
+
+    grid.cascade_cache = TranspositionTable()
+    for _ in range(2): # the second cascade comes from the cache
+        grid.set_board(board)
+        grid.stabilize()
+        assert grid.column_heights.tolist() == [280, 0, 0, 0]
+    assert grid.cascade_cache.hits == 1
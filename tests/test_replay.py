@@ -0,0 +1,52 @@
+"""
+Tests of replay.py: seeking in a recorded game gives the same session as
+playing the game from the start.
+"""
+
+import random
+
+import pytest
+
+from game_session import GameSession
+from replay import ReplayReader, ReplayWriter, REPLAY_EXTENSION
+from self_play import random_drops
+from zobrist import board_hash
+
+
+def record_game(path, seed=7, grid_h=12, grid_w=8, max_steps=2000):
+    policy = random_drops(random.Random(seed))
+    session = GameSession(grid_h, grid_w, seed=seed)
+    with ReplayWriter(path, seed, grid_h, grid_w, keyframe_interval=10) as writer:
+        for frame in range(max_steps):
+            if session.game_over:
+                break
+            action = policy(session)
+            session.step(action)
+            writer.record(frame, action, session)
+    return session
+
+
+def test_seek_matches_playing_from_the_start(tmp_path):
+    path = tmp_path / ("game" + REPLAY_EXTENSION)
+    record_game(path)
+    reader = ReplayReader(path)
+    assert reader.keyframes, "the game is long enough for keyframes"
+    for piece_index in (5, 10, 25, 40):
+        session, record_index = reader.seek(piece_index)
+        played = reader.replay(stop=record_index)
+        assert session.pieces_placed == played.pieces_placed
+        assert (session.grid.exponent_matrix == played.grid.exponent_matrix).all()
+        assert session.grid.score == played.grid.score
+        # resuming from a keyframe keeps the board hash in step with the board
+        assert session.grid.board_hash == board_hash(session.grid.exponent_matrix)
+        assert session.grid.board_hash == played.grid.board_hash
+        assert session.grid.zobrist_hash == played.grid.zobrist_hash
+
+
+def test_a_replay_is_never_overwritten(tmp_path):
+    path = tmp_path / ("game" + REPLAY_EXTENSION)
+    record_game(path, max_steps=20)
+    size = path.stat().st_size
+    with pytest.raises(FileExistsError):
+        ReplayWriter(path, 1, 12, 8)
+    assert path.stat().st_size == size
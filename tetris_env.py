@@ -0,0 +1,152 @@
+from game_session import GameSession, ACTIONS  # the game logic and its actions
+from tetromino import ROTATION_STATES  # the cells of the pieces
+from tile import get_stddraw, number_to_exponent
+import numpy as np  # fundamental Python module for scientific computing
+
+# The planes of an observation: the locked tiles, the current piece and the
+# next piece (at the place where it will spawn), all as tile exponents
+BOARD_PLANE, PIECE_PLANE, NEXT_PIECE_PLANE = 0, 1, 2
+N_PLANES = 3
+
+
+# A class for playing Tetris 2048 as a reinforcement learning environment
+class TetrisEnv:
+    """
+    A Gym-style environment around GameSession: reset(seed) starts a game
+    and returns (observation, info), step(action) applies one of ACTIONS
+    (or its index) and returns (observation, reward, terminated, truncated,
+    info) where the reward is the score gained, and render() draws the game
+    (stddraw is only imported by the first call).
+    The observation is a read-only (N_PLANES, grid_h, grid_w) uint8 view of
+    a buffer of the environment: the exponent matrix of the game grid is the
+    BOARD_PLANE of this buffer and the pieces are written to their planes
+    cell by cell, so the observation is never rebuilt or copied. It is the
+    same array after every step, so copy it to keep an old observation.
+    """
+
+    # A constructor for an environment with the given grid size, where games
+    # are cut short after max_steps steps (no limit for None); buffer is an
+    # optional (N_PLANES, grid_h, grid_w) uint8 array to keep the planes in
+    def __init__(self, grid_h=20, grid_w=12, max_steps=None, buffer=None):
+        self.grid_height, self.grid_width = grid_h, grid_w
+        self.max_steps = max_steps
+        self.n_actions = len(ACTIONS)
+        if buffer is None:
+            buffer = np.zeros((N_PLANES, grid_h, grid_w), dtype=np.uint8)
+        self._buffer = buffer
+        self._observation = buffer.view()
+        self._observation.flags.writeable = False
+        # the cells written to the piece planes, for clearing them
+        self._piece_cells = {PIECE_PLANE: [], NEXT_PIECE_PLANE: []}
+        self.session = None
+        self.steps = 0
+        self._canvas_ready = False
+
+    # A method for starting a new game (with random pieces unless a seed is given)
+    def reset(self, seed=None):
+        self._buffer[:] = 0
+        for cells in self._piece_cells.values():
+            cells.clear()
+        self.session = GameSession(self.grid_height, self.grid_width, seed=seed)
+        # the grid works in place on the board plane of the buffer from now on
+        self.session.grid.exponent_matrix = self._buffer[BOARD_PLANE]
+        self.steps = 0
+        self._update_piece_planes()
+        return self._observation, self._info()
+
+    # A method for applying an action (a name or an index of ACTIONS)
+    def step(self, action):
+        if not isinstance(action, str):
+            action = ACTIONS[action]
+        result = self.session.step(action)
+        self.steps += 1
+        self._update_piece_planes()
+        terminated = result.game_over
+        truncated = not terminated and self.max_steps is not None and self.steps >= self.max_steps
+        return self._observation, result.score_delta, terminated, truncated, self._info(result.events)
+
+    # Helper method: the info dict of a step
+    def _info(self, events=()):
+        grid = self.session.grid
+        return {"score": grid.score, "pieces_placed": self.session.pieces_placed,
+                "max_tile": grid.max_tile_number(), "events": events}
+
+    # Helper method: writes the current and the next piece to their planes
+    def _update_piece_planes(self):
+        grid = self.session.grid
+        for plane, tetromino in ((PIECE_PLANE, grid.current_tetromino),
+                                 (NEXT_PIECE_PLANE, grid.next_tetromino)):
+            plane_cells = self._piece_cells[plane]
+            board = self._buffer[plane]
+            for row, col in plane_cells:
+                board[row, col] = 0
+            plane_cells.clear()
+            if tetromino is None:
+                continue
+            offsets, _ = ROTATION_STATES[tetromino.type][tetromino.rotation]
+            x, y = tetromino.bottom_left_cell.x, tetromino.bottom_left_cell.y
+            for tile, (dx, dy) in zip(tetromino.tiles, offsets):
+                row, col = y + dy, x + dx
+                if 0 <= row < self.grid_height and 0 <= col < self.grid_width:
+                    board[row, col] = number_to_exponent(tile.number)
+                    plane_cells.append((row, col))
+
+    # A method for drawing the game in a window (opened by the first call)
+    def render(self):
+        stddraw = get_stddraw()
+        if not self._canvas_ready:
+            # the canvas of Tetris_2048.start: the grid and the side panel next to it
+            canvas_width = self.grid_width + self.session.grid.side_panel_width
+            stddraw.setCanvasSize(40 * canvas_width, 40 * self.grid_height)
+            stddraw.setXscale(-0.5, canvas_width - 0.5)
+            stddraw.setYscale(-0.5, self.grid_height - 0.5)
+            self._canvas_ready = True
+        self.session.grid.display()
+        stddraw.show(0)
+
+
+# A class for stepping several TetrisEnv environments in lock-step
+class VectorTetrisEnv:
+    """
+    Steps n_envs TetrisEnv environments together. The observations of all
+    environments are read-only views of one (n_envs, N_PLANES, grid_h,
+    grid_w) buffer, so a batch of observations needs no stacking or copying.
+    A game that ends is started over right away (with the next seed after
+    the seeds given to reset); the info of its last step is kept under
+    "final_info".
+    """
+
+    # A constructor for n_envs environments with the given grid size
+    def __init__(self, n_envs, grid_h=20, grid_w=12, max_steps=None):
+        self.n_envs = n_envs
+        self._buffer = np.zeros((n_envs, N_PLANES, grid_h, grid_w), dtype=np.uint8)
+        self._observations = self._buffer.view()
+        self._observations.flags.writeable = False
+        self.envs = [TetrisEnv(grid_h, grid_w, max_steps, buffer=self._buffer[i])
+                     for i in range(n_envs)]
+        self._next_seed = None
+
+    # A method for starting new games in all environments (environment i
+    # gets the seed seed + i if a seed is given)
+    def reset(self, seed=None):
+        infos = []
+        for i, env in enumerate(self.envs):
+            infos.append(env.reset(None if seed is None else seed + i)[1])
+        self._next_seed = None if seed is None else seed + self.n_envs
+        return self._observations, infos
+
+    # A method for applying actions[i] to environment i
+    def step(self, actions):
+        rewards = np.zeros(self.n_envs, dtype=np.int64)
+        terminated = np.zeros(self.n_envs, dtype=bool)
+        truncated = np.zeros(self.n_envs, dtype=bool)
+        infos = []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            _, rewards[i], terminated[i], truncated[i], info = env.step(action)
+            if terminated[i] or truncated[i]:
+                seed = self._next_seed
+                if seed is not None:
+                    self._next_seed += 1
+                info = dict(env.reset(seed)[1], final_info=info)
+            infos.append(info)
+        return self._observations, rewards, terminated, truncated, infos
@@ -1,88 +1,76 @@
-from tile import Tile  # used for modeling each tile on the tetrominoes
+from tile import get_tile, draw_tiles  # used for the (shared) tiles on the tetrominoes
 from point import Point  # used for tile positions
-import copy as cp  # the copy module is used for copying tiles and positions
 import random  # the random module is used for generating random values
 import numpy as np  # the fundamental Python module for scientific computing
 
+# The shape of each tetromino type in its initial rotation state, given as the
+# size n of its n x n tile matrix and the (col, row) cells occupied in that
+# matrix counted from the top-left (see the documentation given with this code)
+SHAPES = {
+   'I': (4, ((1, 0), (1, 1), (1, 2), (1, 3))),
+   'O': (2, ((0, 0), (1, 0), (0, 1), (1, 1))), # O is 2x2
+   'Z': (3, ((0, 0), (1, 0), (1, 1), (2, 1))), # Adjusted Z shape slightly based on common Tetris
+   'J': (3, ((0, 0), (1, 0), (2, 0), (2, 1))), # Adjusted J shape
+   'L': (3, ((0, 0), (1, 0), (2, 0), (0, 1))), # Adjusted L shape
+   'S': (3, ((1, 0), (2, 0), (0, 1), (1, 1))), # Adjusted S shape
+   'T': (3, ((0, 0), (1, 0), (2, 0), (1, 1))), # Adjusted T shape
+}
+
+# A function that computes the four rotation states of a tetromino type
+def _compute_rotation_states(shape):
+   n, cells = SHAPES[shape]
+   states = []
+   for rotation in range(4):
+      # (dx, dy) offsets of the tiles from the bottom left cell of the tile
+      # matrix, kept in the same tile order for every rotation state
+      offsets = tuple((col, n - 1 - row) for col, row in cells)
+      dxs, dys = [dx for dx, _ in offsets], [dy for _, dy in offsets]
+      # bounding box of the occupied cells as (min_dx, min_dy, max_dx, max_dy)
+      bounds = (min(dxs), min(dys), max(dxs), max(dys))
+      states.append((offsets, bounds))
+      # rotate the cells 90 degrees clockwise: new row = old col and
+      # new col = n - 1 - old row (O does not rotate)
+      if shape != 'O':
+         cells = tuple((n - 1 - row, col) for col, row in cells)
+   return tuple(states)
+
+# The rotation states of all tetromino types, computed once at import:
+# ROTATION_STATES[shape][rotation] = (offsets, bounds)
+ROTATION_STATES = {shape: _compute_rotation_states(shape) for shape in SHAPES}
+
+# The bottom profile of each rotation state: the (dx, dy) offset of the lowest
+# tile in each column, used for finding how far a tetromino can drop
+BOTTOM_PROFILES = {
+   shape: tuple(
+      tuple((dx, min(tile_dy for tile_dx, tile_dy in offsets if tile_dx == dx))
+            for dx in sorted({tile_dx for tile_dx, _ in offsets}))
+      for offsets, _ in states)
+   for shape, states in ROTATION_STATES.items()
+}
+
 # A class for modeling tetrominoes with 7 different types
 class Tetromino:
    # the dimensions of the game grid (defined as class variables)
    grid_height, grid_width = None, None
 
-   # A constructor for creating a tetromino with a given shape (type)
-   def __init__(self, shape):
+   # A constructor for creating a tetromino with a given shape (type) and
+   # optionally the numbers of its four tiles (random 2s and 4s by default)
+   def __init__(self, shape, numbers=None):
       self.type = shape  # set the type of this tetromino
-      # determine the occupied (non-empty) cells in the tile matrix based on
-      # the shape of this tetromino (see the documentation given with this code)
-      occupied_cells = []
-      if self.type == 'I':
-         n = 4  # n = number of rows = number of columns in the tile matrix
-         # shape of the tetromino I in its initial rotation state
-         occupied_cells.append((1, 0)) # (col, row) from top-left
-         occupied_cells.append((1, 1))
-         occupied_cells.append((1, 2))
-         occupied_cells.append((1, 3))
-      elif self.type == 'O':
-         n = 2 # O is 2x2
-         # shape of the tetromino O in its initial rotation state
-         occupied_cells.append((0, 0))
-         occupied_cells.append((1, 0))
-         occupied_cells.append((0, 1))
-         occupied_cells.append((1, 1))
-      elif self.type == 'Z':
-         n = 3
-         # shape of the tetromino Z in its initial rotation state
-         occupied_cells.append((0, 0)) # Adjusted Z shape slightly based on common Tetris
-         occupied_cells.append((1, 0))
-         occupied_cells.append((1, 1))
-         occupied_cells.append((2, 1))
-      elif self.type == 'J':
-         n = 3
-         # shape of the tetromino J in its initial rotation state
-         occupied_cells.append((0, 0)) # Adjusted J shape
-         occupied_cells.append((1, 0))
-         occupied_cells.append((2, 0))
-         occupied_cells.append((2, 1))
-      elif self.type == 'L':
-         n = 3
-         # shape of the tetromino L in its initial rotation state
-         occupied_cells.append((0, 0)) # Adjusted L shape
-         occupied_cells.append((1, 0))
-         occupied_cells.append((2, 0))
-         occupied_cells.append((0, 1))
-      elif self.type == 'S':
-         n = 3
-         # shape of the tetromino S in its initial rotation state
-         occupied_cells.append((1, 0)) # Adjusted S shape
-         occupied_cells.append((2, 0))
-         occupied_cells.append((0, 1))
-         occupied_cells.append((1, 1))
-      elif self.type == 'T':
-         n = 3
-         # shape of the tetromino T in its initial rotation state
-         occupied_cells.append((0, 0)) # Adjusted T shape
-         occupied_cells.append((1, 0))
-         occupied_cells.append((2, 0))
-         occupied_cells.append((1, 1))
-      # create a matrix of numbered tiles based on the shape of this tetromino
-      self.tile_matrix = np.full((n, n), None)
-      # Rotation center (relative to matrix indices) - adjust per shape if needed
-      # Defaulting to roughly center, may need fine-tuning per piece shape/size
-      self.rotation_center = ( (n - 1) / 2, (n - 1) / 2)
-
-
-      # create the four tiles (minos) of this tetromino and place these tiles
-      # into the tile matrix
-      for i in range(len(occupied_cells)):
-         col_index, row_index = occupied_cells[i][0], occupied_cells[i][1]
-
-         # --- Modification Start: Assign Random Number ---
+      # n = number of rows = number of columns in the tile matrix
+      n, occupied_cells = SHAPES[self.type]
+      self.n = n
+      # the current rotation state (index into ROTATION_STATES[self.type])
+      self.rotation = 0
+      # the min bounded tile matrices built so far, for each rotation state
+      self._bounded_tile_matrices = {}
+
+      # create the four tiles (minos) of this tetromino, in the same order as
+      # the cells of the shape and of the offsets of each rotation state
+      if numbers is None:
          # Choose 2 or 4 with 90% probability for 2 and 10% for 4
-         # random.choices returns a list, so get the first element [0]
-         tile_number = random.choices([2, 4], weights=[0.9, 0.1], k=1)[0]
-
-         # create a tile for each occupied cell of this tetromino
-         self.tile_matrix[row_index][col_index] = Tile(tile_number)
+         numbers = random.choices([2, 4], weights=[0.9, 0.1], k=len(occupied_cells))
+      self.tiles = [get_tile(number) for number in numbers]
       # initialize the position of this tetromino (as the bottom left cell in
       # the tile matrix) with a random horizontal position near the top
       # Ensure the piece spawns high enough, adjust y based on n
@@ -93,85 +81,69 @@ class Tetromino:
       initial_x = Tetromino.grid_width // 2 - n // 2 # Center horizontally
       self.bottom_left_cell.x = max(0, min(initial_x, Tetromino.grid_width - n)) # Clamp within bounds
 
-
-   # A method that computes and returns the position of the cell in the tile
-   # matrix specified by the given row and column indexes on the game grid
-   def get_cell_position(self, row, col):
-      n = len(self.tile_matrix)  # n = number of rows = number of columns
-      position = Point()
-      # Grid X coordinate = bottom_left_x + column index in matrix
-      position.x = self.bottom_left_cell.x + col
-      # Grid Y coordinate = bottom_left_y + distance from bottom row in matrix
-      # Distance from bottom row = (n - 1) - row index
-      position.y = self.bottom_left_cell.y + (n - 1) - row
-      return position
-
-   # A method to return a copy of the tile matrix without any empty row/column,
-   # and the position of the bottom left cell when return_position is set
+   # A method that returns the state of this tetromino as a hashable tuple
+   # (type, rotation, x, y, tile numbers), see from_state
+   def get_state(self):
+      return (self.type, self.rotation, self.bottom_left_cell.x,
+              self.bottom_left_cell.y, tuple(tile.number for tile in self.tiles))
+
+   # A method for creating a tetromino from a state returned by get_state
+   @staticmethod
+   def from_state(state):
+      shape, rotation, x, y, numbers = state
+      tetromino = Tetromino(shape, numbers)
+      tetromino.rotation = rotation
+      tetromino.bottom_left_cell.x, tetromino.bottom_left_cell.y = x, y
+      return tetromino
+
+   # A method that returns the precomputed (offsets, bounds) of the current
+   # rotation state of this tetromino
+   def get_rotation_state(self):
+      return ROTATION_STATES[self.type][self.rotation]
+
+   # A method to return the tile matrix without any empty row/column, and the
+   # position of the bottom left cell when return_position is set
+   # (the matrix holds the tiles of this tetromino, not copies, and is cached
+   # for each rotation state, so it must not be modified)
    def get_min_bounded_tile_matrix(self, return_position=False):
-        n = len(self.tile_matrix)
-        min_row, max_row, min_col, max_col = -1, -1, -1, -1
-
-        # Find the bounds of the actual tiles
-        for r in range(n):
-            for c in range(n):
-                if self.tile_matrix[r][c] is not None:
-                    if min_row == -1: # First tile found
-                        min_row, max_row, min_col, max_col = r, r, c, c
-                    else:
-                        min_row = min(min_row, r)
-                        max_row = max(max_row, r)
-                        min_col = min(min_col, c)
-                        max_col = max(max_col, c)
-
-        # Handle case where tetromino is empty (shouldn't happen)
-        if min_row == -1:
-             if return_position:
-                 return np.array([[]]), cp.copy(self.bottom_left_cell)
-             else:
-                 return np.array([[]])
-
-        # Create the bounded copy
-        bounded_height = max_row - min_row + 1
-        bounded_width = max_col - min_col + 1
-        copy = np.full((bounded_height, bounded_width), None, dtype=object) # Specify dtype=object
-
-        for r in range(min_row, max_row + 1):
-            for c in range(min_col, max_col + 1):
-                if self.tile_matrix[r][c] is not None:
-                    copy[r - min_row][c - min_col] = cp.deepcopy(self.tile_matrix[r][c])
+        offsets, (min_dx, min_dy, max_dx, max_dy) = self.get_rotation_state()
+
+        bounded = self._bounded_tile_matrices.get(self.rotation)
+        if bounded is None:
+            # Create the bounded matrix (matrix row 0 is the top row of the tiles)
+            bounded_height = max_dy - min_dy + 1
+            bounded_width = max_dx - min_dx + 1
+            bounded = np.full((bounded_height, bounded_width), None, dtype=object) # Specify dtype=object
+            for tile, (dx, dy) in zip(self.tiles, offsets):
+                bounded[max_dy - dy][dx - min_dx] = tile
+            self._bounded_tile_matrices[self.rotation] = bounded
 
         if not return_position:
-            return copy
+            return bounded
         else:
-            # Calculate the grid position of the bottom-left cell of the bounded matrix
-            # BLC corresponds to matrix cell (max_row, min_col)
-            blc_position = self.get_cell_position(max_row, min_col)
-            # # The old calculation might have been slightly off depending on interpretation.
-            # # Let's recalculate blc based on the min/max found relative to the original bottom_left_cell
-            # blc_position = cp.copy(self.bottom_left_cell)
-            # # Translate horizontally by min_col
-            # blc_position.translate(min_col, 0)
-            # # Translate vertically. The original y corresponds to row n-1.
-            # # The new bottom row is max_row. The difference in rows is (n-1) - max_row.
-            # # Translate y by this amount.
-            # blc_position.translate(0, (n - 1) - max_row) # This seems correct
-            return copy, blc_position
+            # The grid position of the bottom-left cell of the bounded matrix
+            blc_position = Point(self.bottom_left_cell.x + min_dx,
+                                 self.bottom_left_cell.y + min_dy)
+            return bounded, blc_position
 
 
    # A method for drawing the tetromino on the game grid
    def draw(self):
-      n = len(self.tile_matrix)  # n = number of rows = number of columns
-      for row in range(n):
-         for col in range(n):
-            # draw each occupied cell as a tile on the game grid
-            if self.tile_matrix[row][col] is not None:
-               # get the position of the tile
-               position = self.get_cell_position(row, col)
-               # draw only the tiles that are inside the game grid (visually)
-               # Allow drawing slightly above the grid if piece is spawning/moving there
-               if position.y < Tetromino.grid_height + n: # Allow buffer for spawning anim
-                  self.tile_matrix[row][col].draw(position)
+      draw_tiles(self.get_drawn_tiles())  # one batch of pre-rendered tile images
+
+   # A method for getting the (number, x, y) tiles that draw shows, so that
+   # the cells that changed since the previous frame can be found
+   def get_drawn_tiles(self):
+      offsets, _ = self.get_rotation_state()
+      tiles = []
+      for tile, (dx, dy) in zip(self.tiles, offsets):
+         # get the position of the tile
+         x, y = self.bottom_left_cell.x + dx, self.bottom_left_cell.y + dy
+         # draw only the tiles that are inside the game grid (visually)
+         # Allow drawing slightly above the grid if piece is spawning/moving there
+         if y < Tetromino.grid_height + self.n: # Allow buffer for spawning anim
+            tiles.append((tile.number, x, y))
+      return tiles
 
    # A method for moving this tetromino in a given direction by 1 on the grid
    def move(self, direction, game_grid):
@@ -186,63 +158,58 @@ class Tetromino:
          self.bottom_left_cell.x += 1
       else:  # direction == "down"
          self.bottom_left_cell.y -= 1
+      game_grid.bump_version()  # the tetromino is drawn at a new place
       return True  # a successful move in the given direction
 
+   # A method for dropping this tetromino straight down as far as it can go
+   # (hard drop), returns the number of rows it has fallen
+   def hard_drop(self, game_grid):
+      distance = game_grid.drop_distance(self)
+      if distance > 0:
+         self.bottom_left_cell.y -= distance
+         game_grid.bump_version()
+      return distance
+
    # A method for checking if this tetromino can be moved in a given direction
    # Added check_initial flag for spawn validation
    def can_be_moved(self, direction, game_grid, check_initial=False):
-        n = len(self.tile_matrix)
-        # Iterate through each tile of the tetromino
-        for row in range(n):
-            for col in range(n):
-                if self.tile_matrix[row][col] is not None:
-                    # Calculate the current grid position of the tile
-                    current_pos = self.get_cell_position(row, col)
-                    # Calculate the potential next grid position
-                    next_pos_x, next_pos_y = current_pos.x, current_pos.y
-
-                    if direction == "left":
-                        next_pos_x -= 1
-                    elif direction == "right":
-                        next_pos_x += 1
-                    elif direction == "down":
-                        next_pos_y -= 1
-                    # Add check for "up" or other directions if needed
-
-                    # If check_initial is True, we only check the current position
-                    if check_initial:
-                        if not game_grid.is_inside(current_pos.y, current_pos.x):
-                            # If any part is initially outside (should mainly check above grid height)
-                            if current_pos.y >= Tetromino.grid_height:
-                                return False # Cannot spawn if initially outside top
-                            # Allow spawning if slightly left/right outside if it can correct? No, enforce inside.
-                            if current_pos.x < 0 or current_pos.x >= Tetromino.grid_width:
-                                 return False
-                        # Check if the initial position is occupied
-                        if game_grid.is_occupied(current_pos.y, current_pos.x):
-                            return False
-                        # If checking initial spawn, skip movement checks below for this tile
-                        continue
-
-                    # --- Standard Movement Checks ---
-                    # 1. Check boundary conditions for the next position
-                    if direction == "left" and next_pos_x < 0:
-                        return False
-                    if direction == "right" and next_pos_x >= Tetromino.grid_width:
-                        return False
-                    if direction == "down" and next_pos_y < 0:
-                        return False
-
-                    # 2. Check grid occupation for the next position (only if inside grid)
-                    if game_grid.is_inside(next_pos_y, next_pos_x):
-                         if game_grid.is_occupied(next_pos_y, next_pos_x):
-                              # If moving down and hitting occupied, specific logic might apply (landing)
-                              # For now, any occupied next spot means cannot move there.
-                              return False
-                    # If moving down and the next position is below the grid (y < 0),
-                    # it's also an invalid move (handled by boundary check above).
+        offsets, _ = self.get_rotation_state()
+        board = game_grid.exponent_matrix
+        grid_height, grid_width = Tetromino.grid_height, Tetromino.grid_width
+        x, y = self.bottom_left_cell.x, self.bottom_left_cell.y
+
+        # If check_initial is True, we only check the current position
+        if check_initial:
+            for dx, dy in offsets:
+                col, row = x + dx, y + dy
+                # Cannot spawn if any part is outside the top or the sides of the grid
+                if row >= grid_height or col < 0 or col >= grid_width:
+                    return False
+                # Check if the initial position is occupied
+                if row >= 0 and board[row, col] != 0:
+                    return False
+            return True
 
-        # If we checked all tiles and none caused a conflict for the given direction (or initial placement)
+        # The potential next position of the bottom left cell
+        if direction == "left":
+            x -= 1
+        elif direction == "right":
+            x += 1
+        elif direction == "down":
+            y -= 1
+        # Add check for "up" or other directions if needed
+
+        for dx, dy in offsets:
+            col, row = x + dx, y + dy
+            # 1. Check boundary conditions for the next position
+            if col < 0 or col >= grid_width or row < 0:
+                return False
+            # 2. Check grid occupation for the next position (only if inside grid,
+            # the tiles above the grid can always move)
+            if row < grid_height and board[row, col] != 0:
+                return False
+
+        # If we checked all tiles and none caused a conflict for the given direction
         return True
 
 
@@ -251,41 +218,26 @@ class Tetromino:
         """
         Rotates the tetromino 90 degrees clockwise. Checks for validity before applying.
         """
-        n = len(self.tile_matrix)
         if self.type == 'O': # O doesn't rotate
             return True
 
-        # Create a temporary matrix for the rotated state
-        rotated_matrix = np.full((n, n), None, dtype=object)
-
-        # Perform rotation math (clockwise)
-        # New row = old col
-        # New col = n - 1 - old row
-        for r in range(n):
-            for c in range(n):
-                if self.tile_matrix[r][c] is not None:
-                    new_r = c
-                    new_c = n - 1 - r
-                    if 0 <= new_r < n and 0 <= new_c < n:
-                        rotated_matrix[new_r][new_c] = self.tile_matrix[r][c] # Shallow copy tile reference
+        next_rotation = (self.rotation + 1) % 4
+        offsets, _ = ROTATION_STATES[self.type][next_rotation]
+        board = game_grid.exponent_matrix
+        x, y = self.bottom_left_cell.x, self.bottom_left_cell.y
 
         # Check if the rotated position is valid (within bounds and not occupied)
-        for r_rot in range(n):
-            for c_rot in range(n):
-                if rotated_matrix[r_rot][c_rot] is not None:
-                    # Calculate the potential grid position of this rotated tile
-                    # Use the same logic as get_cell_position relative to bottom_left_cell
-                    grid_x = self.bottom_left_cell.x + c_rot
-                    grid_y = self.bottom_left_cell.y + (n - 1) - r_rot
-
-                    # Check boundaries
-                    if not game_grid.is_inside(grid_y, grid_x):
-                        # Try wall kicks later if needed, for now, just fail rotation
-                        return False
-                    # Check occupation
-                    if game_grid.is_occupied(grid_y, grid_x):
-                        return False
+        for dx, dy in offsets:
+            col, row = x + dx, y + dy
+            # Check boundaries
+            if row < 0 or row >= Tetromino.grid_height or col < 0 or col >= Tetromino.grid_width:
+                # Try wall kicks later if needed, for now, just fail rotation
+                return False
+            # Check occupation
+            if board[row, col] != 0:
+                return False
 
         # If all checks pass, apply the rotation
-        self.tile_matrix = rotated_matrix
+        self.rotation = next_rotation
+        game_grid.bump_version()
         return True
@@ -1,7 +1,18 @@
-import lib.stddraw as stddraw  # used for drawing the tiles to display them
+# stddraw (used for drawing the tiles) is only imported by the first drawing
+# call (see get_stddraw), so the tiles can be used without a display
 from lib.color import Color  # used for coloring the tiles
+from point import Point  # used for drawing the tile images
+
+_stddraw = None
+
+def get_stddraw():
+   """Returns the lib.stddraw module, importing it (and pygame) on first use."""
+   global _stddraw
+   if _stddraw is None:
+      import lib.stddraw as stddraw
+      _stddraw = stddraw
+   return _stddraw
 
-# A class for modeling numbered tiles as in 2048
 # Format: {number: (background_color, foreground_color, box_color)}
 COLOR_MAP = {
     2:    (Color(238, 228, 218), Color(119, 110, 101), Color(187, 173, 160)), # bg, fg, box
@@ -19,6 +30,58 @@ COLOR_MAP = {
     # A default for numbers not explicitly listed (e.g., > 2048)
     'default': (Color(60, 58, 50), Color(249, 246, 242), Color(30, 28, 20))
 }
+
+# Helpers for converting between tile numbers (2, 4, 8, ...) and the compact
+# exponent form stored on the game grid (0 = empty cell, 1 = 2, 2 = 4, ...)
+def number_to_exponent(number):
+   return int(number).bit_length() - 1
+
+def exponent_to_number(exponent):
+   return 1 << int(exponent)
+
+# Tiles only carry a number and its colors, so the game grid shares a single
+# instance per number instead of keeping a Tile object in every cell; shared
+# tiles must not be modified (a merge puts the tile of the new number instead)
+_shared_tiles = {}
+
+def get_tile(number):
+   """Returns a shared Tile for the given number, creating it on first use."""
+   tile = _shared_tiles.get(number)
+   if tile is None:
+      tile = _shared_tiles[number] = Tile(number)
+   return tile
+
+# The images of the tiles (pygame.Surface objects made by stddraw.makeSprite)
+# by number, for cells of _sprite_size pixels; drawn with one blits call
+_tile_sprites = {}
+_sprite_size = None
+
+def _sprites_for(length):
+   """Returns the tile images for square cells with the given side length,
+   dropping the images of the old size when the size in pixels changed."""
+   stddraw = get_stddraw()
+   global _sprite_size
+   size = stddraw.pixelSize(length, length)
+   if size != _sprite_size:
+      _tile_sprites.clear()
+      _sprite_size = size
+   return _tile_sprites
+
+def _render_sprite(number, length):
+   stddraw = get_stddraw()
+   tile = get_tile(number)
+   sprite = _tile_sprites[number] = stddraw.makeSprite(
+      length, length, lambda: tile.draw(Point(0, 0), length))
+   return sprite
+
+def draw_tiles(tiles, length=1):
+   """Draws (number, x, y) tiles centered at (x, y) with a single blits call."""
+   stddraw = get_stddraw()
+   sprites = _sprites_for(length)
+   stddraw.blits([(sprites.get(number) or _render_sprite(number, length), x, y)
+                  for number, x, y in tiles])
+
+# A class for modeling numbered tiles as in 2048
 class Tile:
    # Class variables shared among all Tile objects
    # ---------------------------------------------------------------------------
@@ -28,7 +91,7 @@ class Tile:
    font_family, font_size = "Arial", 14
 
    # A constructor that creates a tile with 2 as the number on it
-   def _init_(self, number= 2):
+   def __init__(self, number= 2):
       # set the number on this tile
       self.number = number
       # set the colors of this tile
@@ -54,14 +117,9 @@ class Tile:
       else:
          self.current_font_size = 14
 
-
-   def update_number_and_color(self, new_number):
-      """Updates the tile's number and its corresponding colors."""
-      self.number = new_number
-      self.update_colors()  # Re-calculate colors and font size
-
    # A method for drawing this tile at a given position with a given length
    def draw(self, position, length=1):  # length defaults to 1
+      stddraw = get_stddraw()
       # draw the tile as a filled square
       stddraw.setPenColor(self.background_color)
       stddraw.filledSquare(position.x, position.y, length / 2)
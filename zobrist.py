@@ -0,0 +1,127 @@
+"""
+zobrist.py
+
+Zobrist hashing of game states and a bounded transposition table. The hash
+of a board is the XOR of one random 64-bit key for each occupied cell,
+chosen by the position of the cell and the exponent of its tile, so a change
+of one cell updates the hash with two XORs. The keys are generated from a
+fixed seed, so a board has the same hash in every process and every run.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from tetromino import SHAPES
+from tile import number_to_exponent
+
+# The seed of the random keys (changing it changes every hash)
+ZOBRIST_SEED = 20482048
+# The number of tile exponents with a key (the tile numbers up to 2**31)
+MAX_EXPONENTS = 32
+
+# The keys of the pieces: PIECE_KEYS[slot][type][tile][exponent] where slot
+# is 0 for the current piece and 1 for the next piece
+PIECE_KEYS = np.random.default_rng([ZOBRIST_SEED, 0]).integers(
+    0, 2**64, (2, len(SHAPES), 4, MAX_EXPONENTS), dtype=np.uint64)
+_PIECE_KEY_LISTS = PIECE_KEYS.tolist()
+_PIECE_TYPE_INDEXES = {shape: index for index, shape in enumerate(SHAPES)}
+
+_cell_keys = {}
+
+#-----------------------------------------------------------------------
+
+def cell_keys(grid_h, grid_w):
+    """
+    Return the keys of the cells of a grid_h x grid_w grid as a uint64 array
+    indexed as [row, col, exponent] (exponent 0, an empty cell, has the key
+    0) and as nested lists of Python ints with the same indexes.
+    """
+    keys = _cell_keys.get((grid_h, grid_w))
+    if keys is None:
+        rng = np.random.default_rng([ZOBRIST_SEED, grid_h, grid_w])
+        array = rng.integers(0, 2**64, (grid_h, grid_w, MAX_EXPONENTS), dtype=np.uint64)
+        array[:, :, 0] = 0
+        keys = _cell_keys[grid_h, grid_w] = (array, array.tolist())
+    return keys
+
+def board_hash(board):
+    """
+    Return the Zobrist hash of board (a 2D array of tile exponents).
+    """
+    board = np.asarray(board)
+    keys, _ = cell_keys(*board.shape)
+    rows, cols = np.nonzero(board)
+    return int(np.bitwise_xor.reduce(keys[rows, cols, board[rows, cols]], initial=np.uint64(0)))
+
+def changed_cells_hash(before, after):
+    """
+    Return the XOR that turns the hash of the board before into the hash of
+    the board after, from the cells that differ between them.
+    """
+    keys, _ = cell_keys(*before.shape)
+    rows, cols = np.nonzero(before != after)
+    return int(np.bitwise_xor.reduce(keys[rows, cols, before[rows, cols]], initial=np.uint64(0)) ^
+               np.bitwise_xor.reduce(keys[rows, cols, after[rows, cols]], initial=np.uint64(0)))
+
+def piece_hash(tetromino, slot):
+    """
+    Return the key of the type and tile numbers of tetromino (0 for None)
+    as the current piece (slot 0) or the next piece (slot 1).
+    """
+    if tetromino is None:
+        return 0
+    keys = _PIECE_KEY_LISTS[slot][_PIECE_TYPE_INDEXES[tetromino.type]]
+    value = 0
+    for tile_keys, tile in zip(keys, tetromino.tiles):
+        value ^= tile_keys[number_to_exponent(tile.number)]
+    return value
+
+#-----------------------------------------------------------------------
+
+class TranspositionTable:
+    """
+    A bounded mapping from hashes to cached results (evaluations of boards,
+    results of cascades, ...) that forgets the least recently used entries
+    when it holds more than max_entries.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for key (default if there is none) and mark
+        it as recently used.
+        """
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """
+        Cache value for key, evicting the least recently used entry if the
+        table is full.
+        """
+        entries = self._entries
+        entries[key] = value
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)